@@ -0,0 +1,104 @@
+"""
+Access token cache for veterinary bloodwork analysis system.
+
+This module memoizes the result of resolving an access token to its
+Admin or User, so repeated requests carrying the same bearer token skip
+JWT verification and the user lookup for a few seconds.
+
+Features:
+- Entries keyed by SHA-256 of the token (raw tokens are never stored)
+- Entry lifetime capped by both the cache TTL and the token expiry
+- Per-user invalidation for password changes and logout
+
+Last updated: 2025-06-22
+Author: Bedirhan Gilgiler
+"""
+
+import hashlib
+import time
+
+from app.models.database_models import Admin, User
+
+
+class AccessTokenCache:
+    """
+    Bounded in-process TTL cache of authenticated principals by access token.
+
+    The cache is only touched from the event loop, so plain dicts are
+    sufficient. When full, the oldest entry is evicted first.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl_seconds (float): Maximum entry lifetime; 0 disables the cache
+            max_size (int): Maximum number of cached tokens
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: dict[bytes, tuple[float, str, Admin | User]] = {}
+        self._keys_by_user: dict[str, set[bytes]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether caching is turned on."""
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Admin | User | None:
+        """Return the cached principal for a token, if still fresh."""
+        if not self.enabled:
+            return None
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._discard(key)
+            return None
+        return entry[2]
+
+    def put(self, token: str, user_id: str, user: Admin | User,
+            token_expires_at: float | None = None) -> None:
+        """
+        Cache the principal resolved from a token.
+
+        Args:
+            token (str): Raw access token
+            user_id (str): Human-readable ID of the principal
+            user (Admin | User): Resolved principal
+            token_expires_at (float | None): Token ``exp`` claim (epoch seconds)
+        """
+        if not self.enabled:
+            return
+        lifetime = self.ttl_seconds
+        if token_expires_at is not None:
+            lifetime = min(lifetime, token_expires_at - time.time())
+            if lifetime <= 0:
+                return
+
+        key = self._key(token)
+        if key not in self._entries and len(self._entries) >= self.max_size:
+            self._discard(next(iter(self._entries)))
+        self._entries[key] = (time.monotonic() + lifetime, user_id, user)
+        self._keys_by_user.setdefault(user_id, set()).add(key)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached token of a user."""
+        for key in self._keys_by_user.pop(user_id, ()):
+            self._entries.pop(key, None)
+
+    def _discard(self, key: bytes) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[1]]
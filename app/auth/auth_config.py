@@ -15,6 +15,12 @@ class AuthConfig:
         self.refresh_token_expire_days = int(
             os.getenv("JWT_REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
+        # Access token cache, shared by every require_authenticated route
+        # (0 disables it)
+        self.access_token_cache_ttl_seconds = float(
+            os.getenv("JWT_CACHE_TTL_SECONDS", "5"))
+        self.access_token_cache_max_size = 10_000
+
         # Password Settings
         self.password_min_length = 8
 
@@ -15,11 +15,17 @@ Last updated: 2025-06-20
 Author: Bedirhan Gilgiler
 """
 
+import asyncio
+import hashlib
+import time
 import uuid
 from datetime import datetime, timezone
+from enum import Enum
 
+from app.auth.auth_cache import AccessTokenCache
 from app.auth.auth_config import AuthConfig
 from app.auth.password_service import PasswordService
+from app.auth.redis_cache import RedisTokenCache
 from app.auth.token_service import TokenService
 from app.models.database_models import (
     Admin,
@@ -34,6 +40,14 @@ from app.repositories.user_repository import UserRepository
 from app.utils.logger_utils import ApplicationLogger
 
 
+class LoginFailure(str, Enum):
+    """Reason AuthService.login refused to issue tokens."""
+    UNKNOWN_USER = "unknown_user"
+    INVALID_PASSWORD = "invalid_password"
+    ACCOUNT_NOT_ALLOWED = "account_not_allowed"  # inactive or not approved
+    ERROR = "error"
+
+
 class AuthService:
     """
     Core authentication service for the veterinary bloodwork analysis system.
@@ -50,7 +64,8 @@ class AuthService:
     """
 
     def __init__(self, user_repo: UserRepository, admin_repo: AdminRepository,
-                 refresh_token_repo: RefreshTokenRepository, config: AuthConfig | None = None):
+                 refresh_token_repo: RefreshTokenRepository, config: AuthConfig | None = None,
+                 shared_token_cache: RedisTokenCache | None = None):
         """Initialize authentication service with required repositories and configuration."""
         self.user_repo = user_repo
         self.admin_repo = admin_repo
@@ -58,6 +73,10 @@ class AuthService:
         self.config = config or AuthConfig()
         self.password_service = PasswordService()
         self.token_service = TokenService(self.config)
+        self.token_cache = AccessTokenCache(
+            self.config.access_token_cache_ttl_seconds,
+            self.config.access_token_cache_max_size)
+        self.shared_token_cache = shared_token_cache
         self.logger = ApplicationLogger.get_logger(__name__)
 
     async def register_user(self, username: str, email: str, password: str,
@@ -82,13 +101,22 @@ class AuthService:
                     f"Registration failed - weak password: {username}")
                 return None
 
+            # Reject duplicates before paying for the password hash
+            username_taken, email_taken = await self.user_repo.exists_username_or_email(
+                username, email)
+            if username_taken or email_taken:
+                self.logger.warning(
+                    f"Registration failed - username or email exists: {username}")
+                return None
+
             # NOTE: This method creates user without user_id - repository will generate it
             # Create new user with secure password hash
             user = User(
                 _id="",  # Will be generated by repository
                 username=username,
                 email=email,
-                hashed_password=self.password_service.hash_password(password),
+                hashed_password=await asyncio.to_thread(
+                    self.password_service.hash_password, password),
                 role=role,
                 profile=profile or {}
             )
@@ -104,7 +132,8 @@ class AuthService:
             return None
 
     async def login(self, username: str, password: str,
-                    device_info: str | None = None, ip_address: str | None = None) -> dict | None:
+                    device_info: str | None = None,
+                    ip_address: str | None = None) -> dict | LoginFailure:
         """
         Authenticate user and generate JWT tokens.
 
@@ -118,11 +147,13 @@ class AuthService:
             ip_address: Optional IP address for audit
 
         Returns:
-            Dictionary with tokens and user info, or None if login failed
+            Dictionary with tokens and user info, or the LoginFailure
+            explaining why login was refused
         """
         try:
-            # Search in users collection first, then admins
-            user = await self.user_repo.get_by_username(username)
+            # Search in users collection first, then admins. The password
+            # hash and status must be current, so the user cache is bypassed
+            user = await self.user_repo.get_by_username(username, use_cache=False)
             is_admin = False
 
             if not user:
@@ -132,31 +163,35 @@ class AuthService:
             if not user:
                 self.logger.warning(
                     f"Login failed - user not found: {username}")
-                return None
+                return LoginFailure.UNKNOWN_USER
 
             # Validate user status based on type
             if is_admin:
                 if not user.is_active:
                     self.logger.warning(
                         f"Login blocked - inactive admin: {username}")
-                    return None
+                    return LoginFailure.ACCOUNT_NOT_ALLOWED
             else:
                 # Regular users need approval and active status
                 from app.models.database_models import User
                 if isinstance(user, User) and user.approval_status != ApprovalStatus.APPROVED:
                     self.logger.warning(
                         f"Login blocked - unapproved user: {username}")
-                    return None
+                    return LoginFailure.ACCOUNT_NOT_ALLOWED
                 if not user.is_active:
                     self.logger.warning(
                         f"Login blocked - inactive user: {username}")
-                    return None
-
-            # Verify password
-            if not self.password_service.verify_password(password, user.hashed_password):
+                    return LoginFailure.ACCOUNT_NOT_ALLOWED
+
+            # Verify password, upgrading legacy bcrypt hashes on success;
+            # hashing is CPU-bound, so it runs off the event loop
+            password_ok, upgraded_hash = await asyncio.to_thread(
+                self.password_service.verify_and_update,
+                password, user.hashed_password)
+            if not password_ok:
                 self.logger.warning(
                     f"Login failed - invalid password: {username}")
-                return None
+                return LoginFailure.INVALID_PASSWORD
 
             # Ensure user has valid ID and get the appropriate ID field
             from app.models.database_models import Admin, User
@@ -167,22 +202,25 @@ class AuthService:
             else:
                 self.logger.error(
                     f"Login error - unknown user type: {username}")
-                return None
+                return LoginFailure.ERROR
 
             if not user_id:
                 self.logger.error(f"Login error - missing user ID: {username}")
-                return None
+                return LoginFailure.ERROR
 
             # Generate JWT tokens
+            kind = "admin" if isinstance(user, Admin) else "user"
             access_token = self.token_service.create_access_token(
                 user_id=user_id,
                 username=user.username,
-                role=user.role
+                role=user.role,
+                kind=kind
             )
 
             refresh_token = self.token_service.create_refresh_token(
                 user_id=user_id,
-                username=user.username
+                username=user.username,
+                kind=kind
             )
 
             # Store refresh token with expiration and audit info
@@ -206,9 +244,13 @@ class AuthService:
             from app.models.database_models import Admin, User
             if isinstance(user, Admin):
                 await self.admin_repo.update_last_login(user_id)
+                if upgraded_hash:
+                    await self.admin_repo.update_password(user_id, upgraded_hash)
                 user_type = "admin"
             elif isinstance(user, User):
                 await self.user_repo.update_last_login(user_id)
+                if upgraded_hash:
+                    await self.user_repo.update_password(user_id, upgraded_hash)
                 user_type = "user"
             else:
                 user_type = "unknown"
@@ -230,7 +272,7 @@ class AuthService:
 
         except Exception as e:
             self.logger.error(f"Login error: {e}")
-            return None
+            return LoginFailure.ERROR
 
     async def refresh_access_token(self, refresh_token: str) -> dict | None:
         """
@@ -249,23 +291,22 @@ class AuthService:
                 self.logger.warning("Token refresh failed - invalid token")
                 return None
 
-            # Check if token exists in database
-            token_record = await self.refresh_token_repo.get_by_token_hash(refresh_token)
-            if not token_record or not token_record.is_active:
-                self.logger.warning("Token refresh failed - expired/revoked")
-                return None
-
             # Extract and validate user
             user_id = self.token_service.get_user_id_from_payload(payload)
             if not user_id:
                 self.logger.warning("Token refresh failed - no user ID")
                 return None
 
-            # Try to find user in both collections
-            user = await self.user_repo.get_by_id(user_id)
-
-            if not user:
-                user = await self.admin_repo.get_by_id(user_id)
+            # Check the stored token and load the account concurrently
+            token_active, user = await asyncio.gather(
+                self.refresh_token_repo.is_active_token(refresh_token),
+                self._get_account_by_id(
+                    user_id, self.token_service.get_kind_from_payload(payload),
+                    use_cache=False)
+            )
+            if not token_active:
+                self.logger.warning("Token refresh failed - expired/revoked")
+                return None
 
             if not user:
                 self.logger.warning(
@@ -300,7 +341,8 @@ class AuthService:
             access_token = self.token_service.create_access_token(
                 user_id=actual_user_id,
                 username=user.username,
-                role=user.role
+                role=user.role,
+                kind="admin" if isinstance(user, Admin) else "user"
             )
 
             self.logger.info(f"Token refreshed: {user.username}")
@@ -327,6 +369,11 @@ class AuthService:
         try:
             success = await self.refresh_token_repo.invalidate_by_hash(refresh_token)
             if success:
+                payload = self.token_service.verify_token(refresh_token)
+                user_id = payload and self.token_service.get_user_id_from_payload(
+                    payload)
+                if user_id:
+                    await self.revoke_cached_tokens(user_id)
                 self.logger.info("Logout successful")
             return success
 
@@ -385,15 +432,13 @@ class AuthService:
                 self.logger.warning("Token verification failed - no user ID")
                 return None
 
-            # Check user collections (users first, then admins)
-            user = await self.user_repo.get_by_id(user_id)
+            # Check user collections (users and admins)
+            user = await self._get_account_by_id(
+                user_id, self.token_service.get_kind_from_payload(payload))
             if not user:
-                admin = await self.admin_repo.get_by_id(user_id)
-                if not admin:
-                    self.logger.warning(
-                        f"Token verification failed - user not found: {user_id}")
-                    return None
-                user = admin
+                self.logger.warning(
+                    f"Token verification failed - user not found: {user_id}")
+                return None
 
             # Validate user status
             if not user.is_active:
@@ -427,6 +472,32 @@ class AuthService:
             self.logger.error(f"Token verification error: {e}")
             return None
 
+    async def get_access_token_claims(self, token: str) -> dict | None:
+        """
+        Verify an access token and return its claims without loading the account.
+
+        For endpoints that only need the caller's ID, username, role or kind.
+        The account is not re-checked, so deactivation takes effect for these
+        endpoints only when the access token expires.
+
+        Args:
+            token: JWT access token
+
+        Returns:
+            Token payload if valid, None otherwise
+        """
+        try:
+            payload = await self._verify_token_shared(token)
+            if not payload or not self.token_service.is_access_token(payload):
+                return None
+            if not self.token_service.get_user_id_from_payload(payload):
+                return None
+            return payload
+
+        except Exception as e:
+            self.logger.error("Error reading access token claims: %s", e)
+            return None
+
     async def get_authenticated_user(self, token: str) -> User | Admin | None:
         """
         Get the authenticated user from a JWT token.
@@ -441,8 +512,11 @@ class AuthService:
             User or Admin object if valid, None otherwise
         """
         try:
-            # Verify and decode the token
-            payload = self.token_service.verify_token(token)
+            cached = self.token_cache.get(token)
+            if cached is not None:
+                return cached
+
+            payload = await self._verify_token_shared(token)
             if not payload:
                 return None
 
@@ -450,23 +524,20 @@ class AuthService:
             if not user_id:
                 return None
 
-            # Try to get user from users collection first
-            user = await self.user_repo.get_by_id(user_id)
-            if user:
-                return user
-
-            # If not found in users, try admins collection
-            admin = await self.admin_repo.get_by_id(user_id)
-            if admin:
-                return admin
+            user = await self._get_account_by_id(
+                user_id, self.token_service.get_kind_from_payload(payload))
+            if not user:
+                return None
 
-            return None
+            self.token_cache.put(token, user_id, user, payload.get("exp"))
+            return user
 
         except Exception as e:
             self.logger.error(f"Error getting authenticated user: {e}")
             return None
 
-    async def change_password(self, user_id: str, current_password: str, new_password: str) -> bool:
+    async def change_password(self, user_id: str, current_password: str, new_password: str,
+                              kind: str | None = None) -> bool:
         """
         Change user password after validating current password.
 
@@ -480,18 +551,16 @@ class AuthService:
             user_id: User or Admin ID (e.g., VET-001, ADM-001)
             current_password: Current password for verification
             new_password: New password to set
+            kind: "admin" or "user" if known; limits the lookup to one collection
 
         Returns:
             True if password changed successfully, False otherwise
         """
         try:
-            # Find the user in either collection
-            user = await self.user_repo.get_by_id(user_id)
-            is_admin = False
-
-            if not user:
-                user = await self.admin_repo.get_by_id(user_id)
-                is_admin = True
+            # Read the current hash, never a cached copy that another
+            # worker's password change may have outdated
+            user = await self._get_account_by_id(user_id, kind, use_cache=False)
+            is_admin = isinstance(user, Admin)
 
             if not user:
                 self.logger.warning(
@@ -499,7 +568,9 @@ class AuthService:
                 return False
 
             # Verify current password
-            if not self.password_service.verify_password(current_password, user.hashed_password):
+            if not await asyncio.to_thread(
+                    self.password_service.verify_password,
+                    current_password, user.hashed_password):
                 self.logger.warning(
                     f"Password change failed - invalid current password: {user_id}")
                 return False
@@ -511,8 +582,8 @@ class AuthService:
                 return False
 
             # Hash the new password
-            new_hashed_password = self.password_service.hash_password(
-                new_password)
+            new_hashed_password = await asyncio.to_thread(
+                self.password_service.hash_password, new_password)
 
             # Update password in appropriate repository
             if is_admin:
@@ -521,6 +592,7 @@ class AuthService:
                 success = await self.user_repo.update_password(user_id, new_hashed_password)
 
             if success:
+                await self.revoke_cached_tokens(user_id)
                 self.logger.info(
                     f"Password changed successfully for user: {user_id}")
                 return True
@@ -532,3 +604,68 @@ class AuthService:
         except Exception as e:
             self.logger.error(f"Password change error: {e}")
             return False
+
+    async def _get_account_by_id(self, user_id: str, kind: str | None = None,
+                                 use_cache: bool = True) -> User | Admin | None:
+        """
+        Load an account by ID.
+
+        With the token's ``kind`` claim only that collection is queried;
+        tokens issued without it look in users and admins concurrently.
+        Pass ``use_cache=False`` when the password hash or status is checked.
+        """
+        if kind == "admin":
+            return await self.admin_repo.get_by_id(user_id)
+        if kind == "user":
+            return await self.user_repo.get_by_id(user_id, use_cache=use_cache)
+
+        user, admin = await asyncio.gather(
+            self.user_repo.get_by_id(user_id, use_cache=use_cache),
+            self.admin_repo.get_by_id(user_id)
+        )
+        return user or admin
+
+    async def _verify_token_shared(self, token: str) -> dict | None:
+        """
+        Verify a token, reusing claims another worker already verified.
+
+        Falls back to plain verification when no shared cache is configured.
+        """
+        if self.shared_token_cache is None:
+            return self.token_service.verify_token(token)
+
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        payload = await self.shared_token_cache.get_token(token_hash)
+        if payload is None:
+            payload = self.token_service.verify_token(token)
+            if payload and "exp" in payload:
+                await self.shared_token_cache.set_token(
+                    token_hash, payload, payload["exp"] - time.time())
+        return payload
+
+    async def revoke_cached_tokens(self, user_id: str) -> None:
+        """
+        Drop a user's cached principal in this worker and announce it to the others.
+
+        Call after any change to the account (password, profile, status) so
+        the next request resolves the updated record.
+        """
+        self._drop_cached_account(user_id)
+        if self.shared_token_cache is not None:
+            await self.shared_token_cache.publish_revocation(user_id)
+
+    def _drop_cached_account(self, user_id: str) -> None:
+        """Evict a user from the token cache and the user lookup cache."""
+        self.token_cache.invalidate_user(user_id)
+        self.user_repo.invalidate_cached_user(user_id)
+
+    def start_cache_listeners(self) -> None:
+        """Subscribe to revocations published by other workers, if Redis is configured."""
+        if self.shared_token_cache is not None:
+            self.shared_token_cache.start_revocation_listener(
+                self._drop_cached_account)
+
+    async def close_caches(self) -> None:
+        """Release the shared cache connection."""
+        if self.shared_token_cache is not None:
+            await self.shared_token_cache.close()
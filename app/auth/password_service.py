@@ -5,7 +5,10 @@ class PasswordService:
     """Simple password hashing and verification service"""
 
     def __init__(self):
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        # New hashes use argon2id; bcrypt hashes still verify and are
+        # reported as needing a rehash
+        self.pwd_context = CryptContext(
+            schemes=["argon2", "bcrypt"], deprecated="auto")
 
     def hash_password(self, password: str) -> str:
         """Hash a password"""
@@ -15,6 +18,11 @@ class PasswordService:
         """Verify a password against its hash"""
         return self.pwd_context.verify(plain_password, hashed_password)
 
+    def verify_and_update(self, plain_password: str,
+                          hashed_password: str) -> tuple[bool, str | None]:
+        """Verify a password; also return a new hash if the stored one is outdated"""
+        return self.pwd_context.verify_and_update(plain_password, hashed_password)
+
     def is_valid_password(self, password: str, min_length: int = 8) -> bool:
         """Basic password validation"""
         return len(password) >= min_length
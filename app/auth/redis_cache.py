@@ -0,0 +1,113 @@
+"""
+Shared Redis token cache for veterinary bloodwork analysis system.
+
+This module provides an optional second cache tier shared by every
+uvicorn worker. It stores decoded access token claims so a token already
+verified by one worker is not verified again by the others, and carries
+user revocations between workers over pub/sub so each worker can evict
+its in-process cache entries.
+
+Redis is used only when REDIS_URL is set. Every Redis failure is logged
+and treated as a cache miss, so authentication keeps working without it.
+
+Last updated: 2025-06-22
+Author: Bedirhan Gilgiler
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Callable, Dict
+
+import redis.asyncio as redis_asyncio
+from app.utils.logger_utils import ApplicationLogger
+
+# Upper bound on how long verified claims are shared between workers
+REDIS_TOKEN_TTL_SECONDS = 300
+
+# Pub/sub channel carrying user IDs whose cached tokens must be dropped
+REVOCATION_CHANNEL = "auth:revocations"
+
+_KEY_PREFIX = "auth:token:"
+
+
+class RedisTokenCache:
+    """
+    Redis-backed cache of verified access token claims.
+
+    Keys are the SHA-256 hex digest of the token, never the token itself.
+    """
+
+    def __init__(self, url: str, max_ttl_seconds: int = REDIS_TOKEN_TTL_SECONDS):
+        """
+        Initialize the Redis client.
+
+        Args:
+            url (str): Redis connection URL
+            max_ttl_seconds (int): Longest lifetime of a cached entry
+        """
+        self.max_ttl_seconds = max_ttl_seconds
+        self._client = redis_asyncio.from_url(url, decode_responses=True)
+        self._listener: asyncio.Task | None = None
+        self.logger = ApplicationLogger.get_logger("redis_token_cache")
+
+    async def get_token(self, token_hash: str) -> Dict[str, Any] | None:
+        """Return cached claims for a token hash, or None on miss or error."""
+        try:
+            raw = await self._client.get(_KEY_PREFIX + token_hash)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            self.logger.warning("Redis token lookup failed: %s", e)
+            return None
+
+    async def set_token(self, token_hash: str, claims: Dict[str, Any], ttl: float) -> None:
+        """Cache claims for at most ``max_ttl_seconds``."""
+        ttl = int(min(ttl, self.max_ttl_seconds))
+        if ttl <= 0:
+            return
+        try:
+            await self._client.set(_KEY_PREFIX + token_hash,
+                                   json.dumps(claims), ex=ttl)
+        except Exception as e:
+            self.logger.warning("Redis token store failed: %s", e)
+
+    async def publish_revocation(self, user_id: str) -> None:
+        """Tell every worker to drop its cached tokens for a user."""
+        try:
+            await self._client.publish(REVOCATION_CHANNEL, user_id)
+        except Exception as e:
+            self.logger.warning("Redis revocation publish failed: %s", e)
+
+    def start_revocation_listener(self, on_revoked: Callable[[str], None]) -> None:
+        """Start a background task calling ``on_revoked(user_id)`` per message."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(
+                self._listen_for_revocations(on_revoked))
+
+    async def _listen_for_revocations(self, on_revoked: Callable[[str], None]) -> None:
+        while True:
+            try:
+                async with self._client.pubsub() as pubsub:
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            on_revoked(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(
+                    "Redis revocation listener failed, retrying: %s", e)
+                await asyncio.sleep(5)
+
+    async def close(self) -> None:
+        """Stop the listener and close the connection pool."""
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        await self._client.aclose()
+
+
+def create_redis_token_cache() -> RedisTokenCache | None:
+    """Build the shared cache when REDIS_URL is configured."""
+    url = os.getenv("REDIS_URL")
+    return RedisTokenCache(url) if url else None
@@ -40,7 +40,8 @@ class TokenService:
         self.config = config
         self.logger = ApplicationLogger.get_logger("token_service")
 
-    def create_access_token(self, user_id: str, username: str, role: str) -> str:
+    def create_access_token(self, user_id: str, username: str, role: str,
+                            kind: str | None = None) -> str:
         """
         Create a short-lived access token.
 
@@ -48,6 +49,7 @@ class TokenService:
             user_id (str): Human-readable user ID (VET-001, TEC-001, ADM-001)
             username (str): Username for login
             role (str): User role for authorization
+            kind (str | None): Account collection, "admin" or "user"
 
         Returns:
             str: Encoded JWT access token
@@ -57,16 +59,19 @@ class TokenService:
             username=username,
             role=role,
             token_type=self.config.access_token_type,
-            expires_delta=self.config.access_token_expire_time
+            expires_delta=self.config.access_token_expire_time,
+            kind=kind
         )
 
-    def create_refresh_token(self, user_id: str, username: str) -> str:
+    def create_refresh_token(self, user_id: str, username: str,
+                             kind: str | None = None) -> str:
         """
         Create a long-lived refresh token.
 
         Args:
             user_id (str): Human-readable user ID (VET-001, TEC-001, ADM-001)
             username (str): Username for login
+            kind (str | None): Account collection, "admin" or "user"
 
         Returns:
             str: Encoded JWT refresh token
@@ -76,11 +81,12 @@ class TokenService:
             username=username,
             role=None,  # Refresh tokens don't need role info
             token_type=self.config.refresh_token_type,
-            expires_delta=self.config.refresh_token_expire_time
+            expires_delta=self.config.refresh_token_expire_time,
+            kind=kind
         )
 
     def _create_token(self, user_id: str, username: str, role: str | None,
-                      token_type: str, expires_delta) -> str:
+                      token_type: str, expires_delta, kind: str | None = None) -> str:
         """
         Create a JWT token with given parameters.
 
@@ -90,6 +96,7 @@ class TokenService:
             role (str | None): User role (only for access tokens)
             token_type (str): Type of token (access/refresh)
             expires_delta: Token expiration time delta
+            kind (str | None): Account collection, "admin" or "user"
 
         Returns:
             str: Encoded JWT token
@@ -109,6 +116,10 @@ class TokenService:
         if role and token_type == self.config.access_token_type:
             payload["role"] = role
 
+        # Lets the account be loaded from its own collection only
+        if kind:
+            payload["kind"] = kind
+
         return jwt.encode(payload, self.config.secret_key, algorithm=self.config.algorithm)
 
     def verify_token(self, token: str) -> Dict[str, Any] | None:
@@ -192,3 +203,15 @@ class TokenService:
             str | None: User role if found (access tokens only)
         """
         return payload.get("role")
+
+    def get_kind_from_payload(self, payload: Dict[str, Any]) -> str | None:
+        """
+        Extract the account kind from token payload.
+
+        Args:
+            payload (Dict[str, Any]): Token payload
+
+        Returns:
+            str | None: "admin" or "user"; None for tokens issued without it
+        """
+        return payload.get("kind")
@@ -17,9 +17,16 @@ class DatabaseConfig:
     database_name: str = os.getenv("DATABASE_NAME", "veterinary_bloodwork")
 
     # Connection pool settings
-    max_pool_size: int = 10
-    min_pool_size: int = 1
-    timeout_ms: int = 5000
+    # Keep warm connections so steady-state requests never pay the
+    # TCP/TLS/auth handshake; fail fast instead of queueing indefinitely.
+    # The pool is per uvicorn worker and shared by every repository, and a
+    # request may hold a few connections at once (concurrent lookups), so
+    # size it to the expected in-flight requests per worker
+    max_pool_size: int = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    min_pool_size: int = int(os.getenv("MONGODB_MIN_POOL_SIZE", "10"))
+    max_idle_time_ms: int = 60000
+    wait_queue_timeout_ms: int = 2000
+    timeout_ms: int = 3000
 
     # Collection names
     patients_collection: str = "patients"
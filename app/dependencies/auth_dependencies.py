@@ -16,13 +16,17 @@ Author: Bedirhan Gilgiler
 Last updated: 2025-06-20
 """
 
-from typing import Union
+from dataclasses import dataclass
+from typing import Any, Literal, Union
 
 from app.auth.auth_config import AuthConfig
 from app.auth.auth_service import AuthService
+from app.auth.redis_cache import create_redis_token_cache
 from app.config.database_config import DatabaseConfig
-from app.models.database_models import Admin, User, UserRole
+from app.models.database_models import Admin, ApprovalStatus, User, UserRole
+from app.repositories.admin_repository import AdminRepository
 from app.repositories.repository_factory import RepositoryFactory
+from app.repositories.user_repository import UserRepository
 from app.services.database_service import DatabaseService
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
@@ -30,6 +34,45 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 # HTTP Bearer token security scheme
 security = HTTPBearer(auto_error=False)
 
+# Enum members by member or stored value, avoiding Enum(value) lookups
+_ROLE_MAP = {m: m for m in UserRole} | {m.value: m for m in UserRole}
+_STATUS_MAP = {m: m for m in ApprovalStatus} | {
+    m.value: m for m in ApprovalStatus}
+
+
+@dataclass(frozen=True, slots=True)
+class AuthenticatedPrincipal:
+    """
+    Authenticated Admin or User with its type-dependent fields normalized.
+
+    Built once per request so handlers read ``user_id``, ``role``,
+    ``approval_status`` and the owning ``repo`` directly instead of
+    branching on the model type.
+    """
+    kind: Literal["admin", "user"]
+    user_id: str
+    username: str
+    email: str
+    role: UserRole
+    approval_status: ApprovalStatus
+    raw: Union[Admin, User]
+    repo: Union[AdminRepository, UserRepository]
+
+    def as_profile_dict(self) -> dict[str, Any]:
+        """Fields of the UserProfile schema."""
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "email": self.email,
+            "role": self.role,
+            "approval_status": self.approval_status,
+            "profile": self.raw.profile,
+            "is_active": self.raw.is_active,
+            "created_at": self.raw.created_at,
+            "last_login": self.raw.last_login,
+        }
+
+
 # Singleton instances for dependency injection
 _database_service = None
 _repository_factory = None
@@ -53,16 +96,24 @@ def get_repository_factory(db_service: DatabaseService = Depends(get_database_se
     return _repository_factory
 
 
-def get_auth_service(repo_factory: RepositoryFactory = Depends(get_repository_factory)) -> AuthService:
-    """Get singleton authentication service instance."""
+async def get_auth_service() -> AuthService:
+    """
+    Get singleton authentication service instance.
+
+    Declared async and without sub-dependencies so FastAPI resolves it on
+    the event loop with a single call per request, instead of running the
+    sync getter chain in the threadpool.
+    """
     global _auth_service
     if _auth_service is None:
+        repo_factory = get_repository_factory(get_database_service())
         config = AuthConfig()
         _auth_service = AuthService(
             user_repo=repo_factory.user_repository,
             admin_repo=repo_factory.admin_repository,
             refresh_token_repo=repo_factory.refresh_token_repository,
-            config=config
+            config=config,
+            shared_token_cache=create_redis_token_cache()
         )
     return _auth_service
 
@@ -105,6 +156,83 @@ async def get_current_authenticated_user(
     return user
 
 
+async def get_access_token_claims(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security),
+    auth_service: AuthService = Depends(get_auth_service)
+) -> dict[str, Any]:
+    """
+    Get the verified claims of the bearer access token, without a database read.
+
+    Use only for endpoints that need nothing beyond the token's ``sub``,
+    ``username``, ``role`` and ``kind``; anything reading or changing the
+    account should depend on require_authenticated instead.
+
+    Returns:
+        dict[str, Any]: Access token payload
+
+    Raises:
+        HTTPException: 401 if the token is missing, invalid or expired
+    """
+    claims = None
+    if credentials:
+        claims = await auth_service.get_access_token_claims(credentials.credentials)
+
+    if not claims:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return claims
+
+
+def _build_principal(current_user: Union[Admin, User],
+                     auth_service: AuthService) -> AuthenticatedPrincipal:
+    """Normalize an Admin or User into an AuthenticatedPrincipal."""
+    if isinstance(current_user, Admin):
+        return AuthenticatedPrincipal(
+            kind="admin",
+            user_id=current_user.admin_id,
+            username=current_user.username,
+            email=current_user.email,
+            # Admin has fixed role
+            role=UserRole.VETERINARIAN if current_user.role == "veterinarian" else UserRole.VETERINARY_TECHNICIAN,
+            # Admins don't have approval status, set as approved by default
+            approval_status=ApprovalStatus.APPROVED,
+            raw=current_user,
+            repo=auth_service.admin_repo
+        )
+
+    return AuthenticatedPrincipal(
+        kind="user",
+        user_id=current_user.user_id,
+        username=current_user.username,
+        email=current_user.email,
+        role=_ROLE_MAP[current_user.role],
+        approval_status=_STATUS_MAP.get(
+            current_user.approval_status, ApprovalStatus.PENDING),
+        raw=current_user,
+        repo=auth_service.user_repo
+    )
+
+
+async def get_authenticated_principal(
+    current_user: Union[Admin, User] = Depends(get_current_authenticated_user),
+    auth_service: AuthService = Depends(get_auth_service)
+) -> AuthenticatedPrincipal:
+    """
+    Get the current authenticated user as a normalized principal.
+
+    Returns:
+        AuthenticatedPrincipal: The authenticated Admin or User
+
+    Raises:
+        HTTPException: 401 if authentication fails
+    """
+    return _build_principal(current_user, auth_service)
+
+
 def require_admin():
     """
     Dependency that requires admin privileges.
@@ -4,6 +4,10 @@ Main FastAPI application for veterinary bloodwork analysis system.
 This module sets up the FastAPI application with all routers, middleware,
 startup/shutdown events, and dependencies.
 
+uvicorn picks uvloop and httptools automatically when they are installed
+(both are in requirements.txt; uvloop is skipped on Windows). The auth
+cache TTLs are sized for that high-throughput setup.
+
 Last updated: 2025-06-22
 Author: Bedirhan Gilgiler
 """
@@ -13,12 +17,15 @@ import sys
 
 import uvicorn
 from app.dependencies.auth_dependencies import (
+    get_access_token_claims,
+    get_auth_service,
     get_database_service,
     get_repository_factory,
-    require_authenticated,
 )
 from app.routers import analysis_router, auth_router, diagnostic_router, patient_router
+from app.services.pdf_analysis_service import get_pdf_analysis_service
 from app.utils.logger_utils import ApplicationLogger
+from app.utils.upload_guard import UploadGuardMiddleware
 from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
@@ -47,6 +54,15 @@ origins = [
     '*'
 ]
 
+# Refuse non-multipart or oversize uploads before the request body is read.
+# Added before CORS so CORS stays outermost and its headers reach the
+# browser on the guard's 413/415 responses too
+app.add_middleware(
+    UploadGuardMiddleware,
+    paths=["/api/v1/analysis/upload"],
+    max_body_size=25 * 1024 * 1024,
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -74,7 +90,21 @@ async def startup_db_client():
 
     try:
         await db_service.connect()
-        await db_service.initialize_database()
+        # Repository queries hint at these indexes and fail without them
+        if not await db_service.initialize_database():
+            raise RuntimeError("Database index initialization failed")
+
+        # Build repositories now that collections are available
+        repository_factory.initialize_repositories()
+        await repository_factory.verify_hinted_indexes()
+
+        # Build the shared analysis service (prompt, AI config) before the
+        # first upload arrives rather than on its request path
+        get_pdf_analysis_service()
+
+        # Evict cached tokens revoked by other workers (when Redis is set up)
+        auth_service = await get_auth_service()
+        auth_service.start_cache_listeners()
 
         # Initialize counters collection (no need to pre-initialize with the new approach)
         logger.info("Using MongoDB atomic operations for ID generation")
@@ -90,6 +120,8 @@ async def startup_db_client():
 async def shutdown_db_client():
     """Disconnect from database on shutdown"""
     logger.info("Shutting down application...")
+    auth_service = await get_auth_service()
+    await auth_service.close_caches()
     await db_service.disconnect()
 
 
@@ -99,18 +131,32 @@ app.include_router(
     patient_router.router, tags=["Patient Management"]
 )
 app.include_router(
-    analysis_router.router, tags=["Bloodwork Analysis"]
+    analysis_router.build_router(), tags=["Bloodwork Analysis"]
 )
 app.include_router(
     diagnostic_router.router, tags=["Diagnostics"]
 )
 
 
+def _ensure_unique_routes(application: FastAPI) -> None:
+    """Fail fast if a router was included twice (duplicate method + path)."""
+    seen = set()
+    for route in application.routes:
+        for method in getattr(route, "methods", None) or ("*",):
+            key = (method, route.path)
+            if key in seen:
+                raise RuntimeError(
+                    f"Route registered more than once: {method} {route.path}")
+            seen.add(key)
+
+
 # Error Handlers
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     """Global exception handler for uncaught exceptions"""
-    logger.error(f"Unhandled exception: {exc}")
+    # Single place where unexpected errors are logged with their traceback
+    logger.error("Unhandled exception on %s %s",
+                 request.method, request.url.path, exc_info=exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error, please try again later"},
@@ -124,9 +170,13 @@ async def health_check():
 
 
 @app.get("/api/protected")
-async def protected_route(current_user=Depends(require_authenticated)):
+async def protected_route(claims=Depends(get_access_token_claims)):
     """Test protected route"""
-    return {"message": f"Hello, {current_user.role}!"}
+    return {"message": f"Hello, {claims.get('role')}!"}
+
+
+# Runs after the last route definition so every route is checked
+_ensure_unique_routes(app)
 
 
 if __name__ == "__main__":
@@ -75,6 +75,28 @@ class Patient(BaseModel):
         populate_by_name = True
 
 
+class PatientListView(BaseModel):
+    """
+    Lightweight projection of Patient for list endpoints.
+
+    Omits the owner and medical history sub-documents, which can be large,
+    so listing queries only transfer the fields a patient table shows.
+    """
+    patient_id: str = Field(..., alias="_id")
+    name: str
+    species: str
+    breed: str
+    birthdate: datetime
+    sex: str
+    assigned_to: str
+    created_at: datetime
+    updated_at: datetime
+    is_active: bool = True
+
+    class Config:
+        populate_by_name = True
+
+
 class AiDiagnostic(BaseModel):
     """
     AI diagnostic model for bloodwork analysis results.
@@ -155,6 +177,25 @@ class User(BaseModel):
         populate_by_name = True
 
 
+class UserListView(BaseModel):
+    """
+    Lightweight projection of User for list endpoints.
+
+    Omits the password hash and profile sub-document so listing queries
+    only transfer the fields a user table actually shows.
+    """
+    user_id: str = Field(..., alias="_id")
+    username: str
+    email: str
+    role: UserRole
+    approval_status: ApprovalStatus = ApprovalStatus.APPROVED
+    is_active: bool = True
+    created_at: datetime
+
+    class Config:
+        populate_by_name = True
+
+
 class Admin(BaseModel):
     """
     Admin model for system administrators.
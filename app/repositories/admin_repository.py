@@ -113,24 +113,15 @@ class AdminRepository:
     async def update_profile(self, admin_id: str, profile_data: dict) -> bool:
         """Update admin profile fields"""
         try:
-            # Extract email if present
-            email = None
-            if 'email' in profile_data:
-                email = profile_data.pop('email')
-
-            # Prepare update data
-            update_data = {}
-
-            # Add profile fields if any remain
-            if profile_data:
-                # Update individual profile fields instead of replacing the whole profile
-                profile_updates = {
-                    f"profile.{key}": value for key, value in profile_data.items()}
-                update_data.update(profile_updates)
-
-            # Add email if present
-            if email:
-                update_data["email"] = email
+            # Update individual profile fields via dotted paths instead of
+            # replacing the whole profile; email lives at the top level.
+            # Everything goes into a single $set so there is only one write.
+            update_data = {
+                f"profile.{key}": value
+                for key, value in profile_data.items() if key != "email"
+            }
+            if profile_data.get("email"):
+                update_data["email"] = profile_data["email"]
 
             # Only update if we have data to update
             if not update_data:
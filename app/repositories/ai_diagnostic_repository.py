@@ -1,9 +1,34 @@
+import time
 from datetime import datetime, timezone
 
 from app.models.database_models import AiDiagnostic
 from app.services.database_service import DatabaseService
 from app.utils.logger_utils import ApplicationLogger
 
+# Compound index created in DatabaseService.initialize_database; serves the
+# per-patient newest-first reads without an in-memory sort
+PATIENT_TEST_DATE_INDEX = [("patient_id", 1), ("test_date", -1)]
+
+# Fields read back for API responses (matches DiagnosticResponse; _id is
+# always included). Anything else stored on a diagnostic stays in Mongo.
+DIAGNOSTIC_RESPONSE_PROJECTION = {
+    "patient_id": 1,
+    "sequence_number": 1,
+    "test_date": 1,
+    "diagnostic_summary": 1,
+    "ai_diagnostic": 1,
+    "pdf_metadata": 1,
+    "processing_info": 1,
+    "veterinarian_review": 1,
+    "created_by": 1,
+    "created_at": 1,
+}
+
+# Read-through cache for the latest diagnostic per patient (polled by the
+# UI); entries are dropped whenever one of the patient's diagnostics changes
+LATEST_CACHE_TTL_SECONDS = 10.0
+LATEST_CACHE_MAX_SIZE = 10_000
+
 
 class AiDiagnosticRepository:
     """Repository for AiDiagnostic data access operations"""
@@ -12,6 +37,22 @@ class AiDiagnosticRepository:
         self.db_service = database_service
         self.collection = database_service.ai_diagnostics
         self.logger = ApplicationLogger.get_logger(__name__)
+        self._latest_cache: dict[str, tuple[float, AiDiagnostic]] = {}
+        # diagnostic_id -> patient_id for entries in _latest_cache
+        self._latest_patient_by_diagnostic: dict[str, str] = {}
+
+    def invalidate_latest(self, patient_id: str) -> None:
+        """Drop the cached latest diagnostic of a patient."""
+        entry = self._latest_cache.pop(patient_id, None)
+        if entry is not None:
+            self._latest_patient_by_diagnostic.pop(
+                entry[1].diagnostic_id, None)
+
+    def _invalidate_latest_for_diagnostic(self, diagnostic_id: str) -> None:
+        """Drop the cached entry that holds this diagnostic, if any."""
+        patient_id = self._latest_patient_by_diagnostic.get(diagnostic_id)
+        if patient_id is not None:
+            self.invalidate_latest(patient_id)
 
     async def _generate_diagnostic_id(self) -> str:
         """
@@ -37,6 +78,7 @@ class AiDiagnosticRepository:
             diagnostic.created_at = datetime.now(timezone.utc)
 
             await self.collection.insert_one(diagnostic.model_dump(by_alias=True))
+            self.invalidate_latest(diagnostic.patient_id)
             self.logger.info(
                 f"Created diagnostic for patient: {diagnostic.patient_id}")
             return diagnostic
@@ -73,16 +115,24 @@ class AiDiagnosticRepository:
             tuple: (list of diagnostics, total count)
         """
         try:
-            # Get total count
-            total = await self.collection.count_documents({"patient_id": patient_id})
-
-            # Get paginated results
-            cursor = self.collection.find(
-                {"patient_id": patient_id}
-            ).sort("test_date", -1).skip(skip).limit(limit)
-
-            docs = await cursor.to_list(length=limit)
-            diagnostics = [AiDiagnostic(**doc) for doc in docs]
+            # Page and total in one round trip over the same index scan
+            cursor = self.collection.aggregate([
+                {"$match": {"patient_id": patient_id}},
+                {"$sort": {"test_date": -1}},
+                {"$facet": {
+                    "rows": [
+                        {"$skip": skip},
+                        {"$limit": limit},
+                        {"$project": DIAGNOSTIC_RESPONSE_PROJECTION},
+                    ],
+                    "total": [{"$count": "n"}],
+                }},
+            ], hint=PATIENT_TEST_DATE_INDEX)
+            results = await cursor.to_list(length=1)
+            facet = results[0] if results else {"rows": [], "total": []}
+
+            total = facet["total"][0]["n"] if facet["total"] else 0
+            diagnostics = [AiDiagnostic(**doc) for doc in facet["rows"]]
 
             self.logger.info(
                 f"Retrieved {len(diagnostics)} of {total} diagnostics for patient: {patient_id}"
@@ -97,13 +147,29 @@ class AiDiagnosticRepository:
 
     async def get_latest_patient_diagnostic(self, patient_id: str) -> AiDiagnostic | None:
         """Get the most recent diagnostic for a patient"""
+        entry = self._latest_cache.get(patient_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                return entry[1]
+            self.invalidate_latest(patient_id)
+
         try:
             doc = await self.collection.find_one(
                 {"patient_id": patient_id},
-                sort=[("test_date", -1)]
+                DIAGNOSTIC_RESPONSE_PROJECTION,
+                sort=[("test_date", -1)],
+                hint=PATIENT_TEST_DATE_INDEX
             )
-
-            return AiDiagnostic(**doc) if doc else None
+            if not doc:
+                return None
+
+            diagnostic = AiDiagnostic(**doc)
+            if len(self._latest_cache) >= LATEST_CACHE_MAX_SIZE:
+                self.invalidate_latest(next(iter(self._latest_cache)))
+            self._latest_cache[patient_id] = (
+                time.monotonic() + LATEST_CACHE_TTL_SECONDS, diagnostic)
+            self._latest_patient_by_diagnostic[diagnostic.diagnostic_id] = patient_id
+            return diagnostic
 
         except Exception as e:
             self.logger.error(f"Error getting latest patient diagnostic: {e}")
@@ -151,6 +217,7 @@ class AiDiagnosticRepository:
                 {"_id": diagnostic_id},
                 {"$set": {"veterinarian_review": review_data}}
             )
+            self._invalidate_latest_for_diagnostic(diagnostic_id)
 
             if result.modified_count > 0:
                 self.logger.info(
@@ -188,6 +255,7 @@ class AiDiagnosticRepository:
                 {"_id": diagnostic_id},
                 {"$set": {"processing_info": processing_info}}
             )
+            self._invalidate_latest_for_diagnostic(diagnostic_id)
 
             return result.modified_count > 0
 
@@ -202,7 +270,8 @@ class AiDiagnosticRepository:
     async def count_for_patient(self, patient_id: str) -> int:
         """Return total number of diagnostics (tests) linked to a patient."""
         try:
-            return await self.collection.count_documents({"patient_id": patient_id})
+            return await self.collection.count_documents(
+                {"patient_id": patient_id}, hint=PATIENT_TEST_DATE_INDEX)
         except Exception as e:
             self.logger.error(
                 f"Error counting diagnostics for patient {patient_id}: {e}")
@@ -1,10 +1,53 @@
+import asyncio
+import time
 from datetime import datetime, timezone
 
-from app.models.database_models import Patient
+from app.models.database_models import Patient, PatientListView
 from app.services.database_service import DatabaseService
 from app.utils.logger_utils import ApplicationLogger
+from app.utils.pagination_utils import (
+    NEWEST_FIRST_SORT,
+    encode_page_cursor,
+    page_after_filter,
+)
+from bson.datetime_ms import DatetimeMS
+from pymongo import ReturnDocument, UpdateOne
 from pymongo.errors import DuplicateKeyError
 
+# Compound index created in DatabaseService.initialize_database
+ASSIGNED_ACTIVE_INDEX = [("assigned_to", 1), ("is_active", 1)]
+ACTIVE_CREATED_INDEX = [("is_active", 1), ("created_at", -1), ("_id", -1)]
+
+# Fields returned by list queries; matches PatientListView (_id is always included)
+PATIENT_LIST_PROJECTION = {
+    "name": 1,
+    "species": 1,
+    "breed": 1,
+    "birthdate": 1,
+    "sex": 1,
+    "assigned_to": 1,
+    "created_at": 1,
+    "updated_at": 1,
+    "is_active": 1,
+}
+
+# Read-through caches for patient detail and list pages. Writes through
+# this repository drop the affected entries; the TTLs bound staleness
+# across workers, which each hold their own cache
+PATIENT_CACHE_TTL_SECONDS = 10.0
+PATIENT_PAGE_CACHE_TTL_SECONDS = 5.0
+PATIENT_CACHE_MAX_SIZE = 10_000
+
+# Name searches use the text index on name/owner_info.name and rank by
+# relevance, newest first among equally relevant matches
+TEXT_SCORE = {"score": {"$meta": "textScore"}}
+TEXT_SEARCH_SORT = [("score", {"$meta": "textScore"}), ("created_at", -1)]
+
+
+def _utc_now_ms() -> DatetimeMS:
+    """Current UTC time as a BSON datetime, skipping datetime conversion on encode"""
+    return DatetimeMS(int(time.time() * 1000))
+
 
 class PatientRepository:
     """Repository for Patient data access operations"""
@@ -13,6 +56,15 @@ class PatientRepository:
         self.db_service = database_service
         self.collection = database_service.patients
         self.logger = ApplicationLogger.get_logger(__name__)
+        self._patient_cache: dict[str, tuple[float, Patient]] = {}
+        self._page_cache: dict[tuple[int, int],
+                               tuple[float, list[Patient], int]] = {}
+
+    def invalidate(self, patient_id: str | None = None) -> None:
+        """Drop a cached patient and every cached list page."""
+        if patient_id is not None:
+            self._patient_cache.pop(patient_id, None)
+        self._page_cache.clear()
 
     async def _generate_patient_id(self) -> str:
         """
@@ -42,45 +94,73 @@ class PatientRepository:
             existing = await self.collection.find_one({"_id": patient.patient_id})
             if existing:
                 self.logger.error(
-                    f"DEBUG: Patient ID {patient.patient_id} already exists in database!")
+                    "DEBUG: Patient ID %s already exists in database!", patient.patient_id)
                 self.logger.error(
-                    f"DEBUG: Existing patient: {existing.get('name', 'Unknown')}")
+                    "DEBUG: Existing patient: %s", existing.get('name', 'Unknown'))
             else:
                 self.logger.info(
-                    f"DEBUG: Patient ID {patient.patient_id} is available for creation")
+                    "DEBUG: Patient ID %s is available for creation", patient.patient_id)
 
-            await self.collection.insert_one(patient.model_dump(by_alias=True))
-            self.logger.info(f"Created patient: {patient.patient_id}")
+            # Pydantic already validated the document; skip server-side validation
+            await self.collection.insert_one(
+                patient.model_dump(by_alias=True), bypass_document_validation=True)
+            self.logger.info("Created patient: %s", patient.patient_id)
+            self.invalidate()
             return patient
 
         except DuplicateKeyError:
             self.logger.error(
-                f"Patient ID already exists: {patient.patient_id}")
+                "Patient ID already exists: %s", patient.patient_id)
             return None
         except Exception as e:
-            self.logger.error(f"Error creating patient: {e}")
+            self.logger.error("Error creating patient: %s", e)
             return None
 
     async def get_by_id(self, patient_id: str) -> Patient | None:
         """Get patient by patient_id"""
+        entry = self._patient_cache.get(patient_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                return entry[1]
+            del self._patient_cache[patient_id]
+
         try:
             doc = await self.collection.find_one({"_id": patient_id})
-            return Patient(**doc) if doc else None
+            if not doc:
+                return None
+
+            patient = Patient(**doc)
+            if len(self._patient_cache) >= PATIENT_CACHE_MAX_SIZE:
+                del self._patient_cache[next(iter(self._patient_cache))]
+            self._patient_cache[patient_id] = (
+                time.monotonic() + PATIENT_CACHE_TTL_SECONDS, patient)
+            return patient
 
         except Exception as e:
-            self.logger.error(f"Error getting patient by id: {e}")
+            self.logger.error("Error getting patient by id: %s", e)
             return None
 
+    async def exists(self, patient_id: str) -> bool:
+        """Check whether a patient exists without loading the document"""
+        try:
+            doc = await self.collection.find_one({"_id": patient_id}, {"_id": 1})
+            return doc is not None
+
+        except Exception as e:
+            self.logger.error("Error checking patient existence: %s", e)
+            return False
+
     async def get_by_user_id(self, user_id: str) -> list[Patient]:
         """Get all patients assigned to a user"""
         try:
             cursor = self.collection.find(
-                {"assigned_to": user_id, "is_active": True})
+                {"assigned_to": user_id, "is_active": True},
+                hint=ASSIGNED_ACTIVE_INDEX)
             docs = await cursor.to_list(length=None)
             return [Patient(**doc) for doc in docs]
 
         except Exception as e:
-            self.logger.error(f"Error getting patients by user_id: {e}")
+            self.logger.error("Error getting patients by user_id: %s", e)
             return []
 
     async def get_all(self, skip: int = 0, limit: int = 10) -> tuple[list[Patient], int]:
@@ -94,36 +174,87 @@ class PatientRepository:
         Returns:
             tuple[list[Patient], int]: List of patients and total count
         """
+        entry = self._page_cache.get((skip, limit))
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                return entry[1], entry[2]
+            del self._page_cache[(skip, limit)]
+
         try:
             # Debug logging to see what database and collection we're using
             database_name = self.db_service.database.name if self.db_service.database is not None else 'Unknown'
-            self.logger.info(f"Querying database: {database_name}")
-            self.logger.info(f"Querying collection: {self.collection.name}")
+            self.logger.info("Querying database: %s", database_name)
+            self.logger.info("Querying collection: %s", self.collection.name)
 
-            # Get total count first (for pagination metadata)
-            total = await self.collection.count_documents({"is_active": True})
-
-            # Then get the paginated results
+            # The count (for pagination metadata) and the page are
+            # independent, so run both queries concurrently
             cursor = self.collection.find(
                 {"is_active": True}
             ).sort("created_at", -1).skip(skip).limit(limit)
 
-            docs = await cursor.to_list(length=limit)
+            docs, total = await asyncio.gather(
+                cursor.to_list(length=limit),
+                self.collection.count_documents({"is_active": True})
+            )
             self.logger.info(
-                f"Found {len(docs)} patient documents (page {skip//limit + 1}, total: {total})")
+                "Found %s patient documents (page %s, total: %s)",
+                len(docs), skip//limit + 1, total)
 
             # Debug: let's see what the first document looks like
             if docs:
                 first_doc = docs[0]
                 self.logger.info(
-                    f"First document: patient_id={first_doc.get('patient_id')}, created_by={first_doc.get('created_by')}, assigned_to={first_doc.get('assigned_to')}")
+                    "First document: patient_id=%s, created_by=%s, assigned_to=%s",
+                    first_doc.get('patient_id'), first_doc.get('created_by'),
+                    first_doc.get('assigned_to'))
 
-            return [Patient(**doc) for doc in docs], total
+            patients = [Patient(**doc) for doc in docs]
+            if len(self._page_cache) >= PATIENT_CACHE_MAX_SIZE:
+                del self._page_cache[next(iter(self._page_cache))]
+            self._page_cache[(skip, limit)] = (
+                time.monotonic() + PATIENT_PAGE_CACHE_TTL_SECONDS, patients, total)
+            return patients, total
 
         except Exception as e:
-            self.logger.error(f"Error getting all patients: {e}")
+            self.logger.error("Error getting all patients: %s", e)
             return [], 0
 
+    def get_page_cursor(self, skip: int = 0, limit: int = 10, name: str | None = None):
+        """
+        Open a cursor over one page of active patients, newest first.
+
+        Documents are decoded one batch at a time as the cursor is iterated,
+        so callers can stream a page without holding it all in memory.
+
+        Args:
+            skip (int): Number of records to skip
+            limit (int): Maximum number of records to return
+            name (str | None): Optional text search on the patient name
+
+        Returns:
+            AsyncIOMotorCursor: Cursor yielding raw patient documents
+        """
+        if name is None:
+            cursor = self.collection.find({"is_active": True}).sort("created_at", -1)
+        else:
+            cursor = self.collection.find(
+                {"$text": {"$search": name}, "is_active": True},
+                TEXT_SCORE
+            ).sort(TEXT_SEARCH_SORT)
+        return cursor.skip(skip).limit(limit)
+
+    async def count_active(self, name: str | None = None) -> int:
+        """Count active patients, optionally restricted to a name search"""
+        query = {"is_active": True}
+        if name is not None:
+            query["$text"] = {"$search": name}
+        try:
+            return await self.collection.count_documents(query)
+
+        except Exception as e:
+            self.logger.error("Error counting patients: %s", e)
+            return 0
+
     async def search_by_name(self, name: str, skip: int = 0, limit: int = 10) -> tuple[list[Patient], int]:
         """
         Search patients by name with pagination support.
@@ -137,63 +268,188 @@ class PatientRepository:
             tuple[list[Patient], int]: List of matching patients and total count
         """
         try:
-            # Get total count first (for pagination metadata)
-            total = await self.collection.count_documents(
-                {"$text": {"$search": name}, "is_active": True}
-            )
+            query = {"$text": {"$search": name}, "is_active": True}
 
-            # Then get the paginated results
-            cursor = self.collection.find(
-                {"$text": {"$search": name}, "is_active": True}
-            ).sort("created_at", -1).skip(skip).limit(limit)
+            # Fetch the page (best matches first) and the total concurrently
+            cursor = self.collection.find(query, TEXT_SCORE) \
+                .sort(TEXT_SEARCH_SORT).skip(skip).limit(limit)
 
-            docs = await cursor.to_list(length=limit)
+            docs, total = await asyncio.gather(
+                cursor.to_list(length=limit),
+                self.collection.count_documents(query)
+            )
             self.logger.info(
-                f"Found {len(docs)} patients matching '{name}' (page {skip//limit + 1}, total: {total})")
+                "Found %s patients matching '%s' (page %s, total: %s)",
+                len(docs), name, skip//limit + 1, total)
 
             return [Patient(**doc) for doc in docs], total
 
         except Exception as e:
-            self.logger.error(f"Error searching patients by name: {e}")
+            self.logger.error("Error searching patients by name: %s", e)
             return [], 0
 
     async def update(self, patient_id: str, update_data: dict) -> bool:
         """Update patient data"""
         try:
-            update_data["updated_at"] = datetime.now(timezone.utc)
+            update_data["updated_at"] = _utc_now_ms()
 
             result = await self.collection.update_one(
                 {"_id": patient_id},
-                {"$set": update_data}
+                {"$set": update_data},
+                bypass_document_validation=True
             )
 
             if result.modified_count > 0:
-                self.logger.info(f"Updated patient: {patient_id}")
+                self.logger.info("Updated patient: %s", patient_id)
+                self.invalidate(patient_id)
                 return True
             return False
 
         except Exception as e:
-            self.logger.error(f"Error updating patient: {e}")
+            self.logger.error("Error updating patient: %s", e)
             return False
 
+    async def update_and_get(self, patient_id: str, update_data: dict) -> Patient | None:
+        """
+        Update patient data and return the updated document in one round trip.
+
+        Args:
+            patient_id (str): Patient ID to update
+            update_data (dict): Fields to set
+
+        Returns:
+            Patient | None: Updated patient, or None if it does not exist
+
+        Raises:
+            Exception: Database errors are logged and re-raised, so a failed
+                update is not reported as a missing patient
+        """
+        update_data["updated_at"] = _utc_now_ms()
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": patient_id},
+                {"$set": update_data},
+                return_document=ReturnDocument.AFTER,
+                bypass_document_validation=True
+            )
+        except Exception as e:
+            self.logger.error("Error updating patient: %s", e)
+            # The update may have been applied before the error surfaced
+            self.invalidate(patient_id)
+            raise
+
+        self.invalidate(patient_id)
+        if doc is None:
+            return None
+        self.logger.info("Updated patient: %s", patient_id)
+        return Patient(**doc)
+
     async def soft_delete(self, patient_id: str) -> bool:
-        """Soft delete patient (set is_active to False)"""
+        """
+        Soft delete patient (set is_active to False).
+
+        Returns:
+            bool: True if an active patient was deactivated, False if no
+            active patient has this ID
+        """
         try:
             result = await self.collection.update_one(
-                {"_id": patient_id},
-                {"$set": {"is_active": False,
-                          "updated_at": datetime.now(timezone.utc)}}
+                {"_id": patient_id, "is_active": True},
+                {"$set": {"is_active": False, "updated_at": _utc_now_ms()}}
             )
 
-            if result.modified_count > 0:
-                self.logger.info(f"Soft deleted patient: {patient_id}")
+            if result.matched_count > 0:
+                self.logger.info("Soft deleted patient: %s", patient_id)
+                self.invalidate(patient_id)
                 return True
             return False
 
         except Exception as e:
-            self.logger.error(f"Error soft deleting patient: {e}")
+            self.logger.error("Error soft deleting patient: %s", e)
             return False
 
+    async def soft_delete_many(self, patient_ids: list[str]) -> int:
+        """
+        Soft delete several patients in a single round trip.
+
+        Args:
+            patient_ids (list[str]): Patient IDs to deactivate
+
+        Returns:
+            int: Number of patients that were deactivated
+        """
+        if not patient_ids:
+            return 0
+
+        try:
+            now = _utc_now_ms()
+            operations = [
+                UpdateOne({"_id": patient_id},
+                          {"$set": {"is_active": False, "updated_at": now}})
+                for patient_id in patient_ids
+            ]
+            result = await self.collection.bulk_write(operations, ordered=False)
+            for patient_id in patient_ids:
+                self._patient_cache.pop(patient_id, None)
+            self._page_cache.clear()
+
+            self.logger.info(
+                "Soft deleted %s of %s patients", result.modified_count, len(patient_ids))
+            return result.modified_count
+
+        except Exception as e:
+            self.logger.error("Error soft deleting patients: %s", e)
+            return 0
+
+    async def get_page_after(
+        self,
+        cursor: str | None = None,
+        limit: int = 10
+    ) -> tuple[list[PatientListView], str | None]:
+        """
+        Get a page of active patients, newest first, using keyset pagination.
+
+        Unlike get_all this neither skips nor counts, so the cost of a page
+        does not grow with its depth.
+
+        Args:
+            cursor (str | None): next_cursor of the previous page, or None
+                for the first page
+            limit (int): Maximum number of records to return
+
+        Returns:
+            tuple[list[PatientListView], str | None]: Patients and the cursor of the
+            next page (None on the last page)
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        query: dict = {"is_active": True}
+        if cursor is not None:
+            query.update(page_after_filter(cursor))
+
+        try:
+            docs = await self.collection.find(
+                query,
+                PATIENT_LIST_PROJECTION,
+                sort=NEWEST_FIRST_SORT,
+                limit=limit + 1,
+                hint=ACTIVE_CREATED_INDEX
+            ).to_list(length=limit + 1)
+
+            # The extra document only signals that another page exists.
+            # Documents were validated on write; skip re-validation
+            patients = [PatientListView.model_construct(**doc)
+                        for doc in docs[:limit]]
+            last = patients[-1] if len(docs) > limit else None
+            next_cursor = (encode_page_cursor(last.created_at, last.patient_id)
+                           if last is not None else None)
+            return patients, next_cursor
+
+        except Exception as e:
+            self.logger.error("Error getting patient page: %s", e)
+            return [], None
+
     async def get_recent(self, limit: int = 10) -> list[Patient]:
         """Get recently created active patients"""
         try:
@@ -205,5 +461,5 @@ class PatientRepository:
             return [Patient(**doc) for doc in docs]
 
         except Exception as e:
-            self.logger.error(f"Error getting recent patients: {e}")
+            self.logger.error("Error getting recent patients: %s", e)
             return []
@@ -21,6 +21,10 @@ from datetime import datetime, timezone
 from app.models.database_models import RefreshToken
 from app.services.database_service import DatabaseService
 from app.utils.logger_utils import ApplicationLogger
+from pymongo import UpdateOne
+
+# Compound index created in DatabaseService.initialize_database
+USER_ACTIVE_INDEX = [("user_id", 1), ("is_active", 1)]
 
 
 class RefreshTokenRepository:
@@ -48,13 +52,15 @@ class RefreshTokenRepository:
         try:
             token.created_at = datetime.now(timezone.utc)
 
-            await self.collection.insert_one(token.model_dump(by_alias=True))
+            # Pydantic already validated the document; skip server-side validation
+            await self.collection.insert_one(
+                token.model_dump(by_alias=True), bypass_document_validation=True)
             self.logger.info(
-                f"Created refresh token for user: {token.user_id}")
+                "Created refresh token for user: %s", token.user_id)
             return token
 
         except Exception as e:
-            self.logger.error(f"Error creating refresh token: {e}")
+            self.logger.error("Error creating refresh token: %s", e)
             return None
 
     async def get_by_token_id(self, token_id: str) -> RefreshToken | None:
@@ -64,7 +70,7 @@ class RefreshTokenRepository:
             return RefreshToken(**doc) if doc else None
 
         except Exception as e:
-            self.logger.error(f"Error getting refresh token by id: {e}")
+            self.logger.error("Error getting refresh token by id: %s", e)
             return None
 
     async def get_by_token_hash(self, token_hash: str) -> RefreshToken | None:
@@ -74,9 +80,37 @@ class RefreshTokenRepository:
             return RefreshToken(**doc) if doc else None
 
         except Exception as e:
-            self.logger.error(f"Error getting refresh token by hash: {e}")
+            self.logger.error("Error getting refresh token by hash: %s", e)
             return None
 
+    async def is_active_token(self, token_hash: str) -> bool:
+        """
+        Check that a refresh token is stored, active and not expired.
+
+        The whole check runs in the query filter with an _id-only projection,
+        so no RefreshToken is built just to read is_active.
+
+        Args:
+            token_hash (str): Stored token value
+
+        Returns:
+            bool: True if the token can still be used
+        """
+        try:
+            doc = await self.collection.find_one(
+                {
+                    "token_hash": token_hash,
+                    "is_active": True,
+                    "expires_at": {"$gt": datetime.now(timezone.utc)}
+                },
+                {"_id": 1}
+            )
+            return doc is not None
+
+        except Exception as e:
+            self.logger.error("Error checking refresh token: %s", e)
+            return False
+
     async def get_by_user_id(self, user_id: str) -> list[RefreshToken]:
         """Get all refresh tokens for a user"""
         try:
@@ -88,7 +122,7 @@ class RefreshTokenRepository:
             return [RefreshToken(**doc) for doc in docs]
 
         except Exception as e:
-            self.logger.error(f"Error getting refresh tokens by user_id: {e}")
+            self.logger.error("Error getting refresh tokens by user_id: %s", e)
             return []
 
     async def invalidate(self, token_id: str) -> bool:
@@ -100,14 +134,42 @@ class RefreshTokenRepository:
             )
 
             if result.modified_count > 0:
-                self.logger.info(f"Invalidated refresh token: {token_id}")
+                self.logger.info("Invalidated refresh token: %s", token_id)
                 return True
             return False
 
         except Exception as e:
-            self.logger.error(f"Error invalidating refresh token: {e}")
+            self.logger.error("Error invalidating refresh token: %s", e)
             return False
 
+    async def invalidate_many(self, token_ids: list[str]) -> int:
+        """
+        Invalidate several refresh tokens in a single round trip.
+
+        Args:
+            token_ids (list[str]): Token IDs to invalidate
+
+        Returns:
+            int: Number of tokens that were invalidated
+        """
+        if not token_ids:
+            return 0
+
+        try:
+            operations = [
+                UpdateOne({"_id": token_id}, {"$set": {"is_active": False}})
+                for token_id in token_ids
+            ]
+            result = await self.collection.bulk_write(operations, ordered=False)
+
+            self.logger.info(
+                "Invalidated %s of %s refresh tokens", result.modified_count, len(token_ids))
+            return result.modified_count
+
+        except Exception as e:
+            self.logger.error("Error invalidating refresh tokens: %s", e)
+            return 0
+
     async def invalidate_by_hash(self, token_hash: str) -> bool:
         """Invalidate a refresh token by hash"""
         try:
@@ -122,7 +184,7 @@ class RefreshTokenRepository:
             return False
 
         except Exception as e:
-            self.logger.error(f"Error invalidating refresh token by hash: {e}")
+            self.logger.error("Error invalidating refresh token by hash: %s", e)
             return False
 
     async def invalidate_all_for_user(self, user_id: str) -> bool:
@@ -130,20 +192,26 @@ class RefreshTokenRepository:
         try:
             result = await self.collection.update_many(
                 {"user_id": user_id, "is_active": True},
-                {"$set": {"is_active": False}}
+                {"$set": {"is_active": False}},
+                hint=USER_ACTIVE_INDEX
             )
 
             self.logger.info(
-                f"Invalidated {result.modified_count} refresh tokens for user: {user_id}")
+                "Invalidated %s refresh tokens for user: %s", result.modified_count, user_id)
             return True
 
         except Exception as e:
             self.logger.error(
-                f"Error invalidating refresh tokens for user: {e}")
+                "Error invalidating refresh tokens for user: %s", e)
             return False
 
     async def clean_expired(self) -> int:
-        """Clean up expired refresh tokens"""
+        """
+        Clean up expired refresh tokens.
+
+        Expired tokens are normally removed by the TTL index on expires_at
+        (see DatabaseService.initialize_database); this is a manual backstop.
+        """
         try:
             now = datetime.now(timezone.utc)
             result = await self.collection.delete_many(
@@ -151,9 +219,12 @@ class RefreshTokenRepository:
             )
 
             count = result.deleted_count
-            self.logger.info(f"Cleaned up {count} expired refresh tokens")
+            if count > 0:
+                # The TTL monitor should have already removed these
+                self.logger.warning(
+                    "Cleaned up %s expired refresh tokens missed by the TTL index", count)
             return count
 
         except Exception as e:
-            self.logger.error(f"Error cleaning expired refresh tokens: {e}")
+            self.logger.error("Error cleaning expired refresh tokens: %s", e)
             return 0
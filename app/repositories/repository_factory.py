@@ -1,7 +1,17 @@
 from app.repositories.admin_repository import AdminRepository
-from app.repositories.ai_diagnostic_repository import AiDiagnosticRepository
-from app.repositories.patient_repository import PatientRepository
-from app.repositories.refresh_token_repository import RefreshTokenRepository
+from app.repositories.ai_diagnostic_repository import (
+    PATIENT_TEST_DATE_INDEX,
+    AiDiagnosticRepository,
+)
+from app.repositories.patient_repository import (
+    ACTIVE_CREATED_INDEX,
+    ASSIGNED_ACTIVE_INDEX,
+    PatientRepository,
+)
+from app.repositories.refresh_token_repository import (
+    USER_ACTIVE_INDEX,
+    RefreshTokenRepository,
+)
 from app.repositories.user_repository import UserRepository
 from app.services.database_service import DatabaseService
 
@@ -17,6 +27,42 @@ class RepositoryFactory:
         self._ai_diagnostic_repo = None
         self._refresh_token_repo = None
 
+    def initialize_repositories(self) -> None:
+        """
+        Eagerly create every repository instance.
+
+        Repositories bind their collection on construction, so this must run
+        after the database service has connected (see the startup hook in
+        app.main). Doing it there keeps repository setup off the first request.
+        """
+        _ = self.patient_repository
+        _ = self.user_repository
+        _ = self.admin_repository
+        _ = self.ai_diagnostic_repository
+        _ = self.refresh_token_repository
+
+    async def verify_hinted_indexes(self) -> None:
+        """
+        Make sure every index a repository query hints at exists.
+
+        Must run after initialize_database(), which creates them.
+
+        Raises:
+            RuntimeError: If a hinted index is missing
+        """
+        hinted = [
+            (self.patient_repository.collection,
+             [ASSIGNED_ACTIVE_INDEX, ACTIVE_CREATED_INDEX]),
+            (self.ai_diagnostic_repository.collection, [PATIENT_TEST_DATE_INDEX]),
+            (self.refresh_token_repository.collection, [USER_ACTIVE_INDEX]),
+        ]
+        for collection, key_patterns in hinted:
+            missing = await self.database_service.missing_indexes(
+                collection, key_patterns)
+            if missing:
+                raise RuntimeError(
+                    f"Hinted indexes missing on {collection.name}: {missing}")
+
     @property
     def patient_repository(self) -> PatientRepository:
         """Get PatientRepository instance (singleton pattern)"""
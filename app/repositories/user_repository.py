@@ -16,13 +16,56 @@ Last updated: 2025-06-20
 Author: Bedirhan Gilgiler
 """
 
+import time
 from datetime import datetime, timezone
 from typing import List, Optional
 
-from app.models.database_models import ApprovalStatus, User, UserRole
+from app.models.database_models import (
+    ApprovalStatus,
+    User,
+    UserListView,
+    UserRole,
+)
 from app.services.database_service import DatabaseService
 from app.utils.logger_utils import ApplicationLogger
-from pymongo.errors import DuplicateKeyError
+from app.utils.pagination_utils import (
+    NEWEST_FIRST_SORT,
+    encode_page_cursor,
+    page_after_filter,
+)
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_LOGGER = ApplicationLogger.get_logger(__name__)
+_UTC = timezone.utc
+
+# Fields returned by list queries; matches UserListView (_id is always included)
+USER_LIST_PROJECTION = {
+    "username": 1,
+    "email": 1,
+    "role": 1,
+    "approval_status": 1,
+    "is_active": 1,
+    "created_at": 1,
+}
+
+# Listing pages are bounded; callers page with the next_cursor keyset
+DEFAULT_LIST_LIMIT = 100
+LIST_BATCH_SIZE = 200
+
+# (ID prefix, counter document _id) per role, resolved once at import
+USER_ID_SEQUENCES = {
+    UserRole.VETERINARIAN: ("VET", f"{UserRole.VETERINARIAN.value}_seq"),
+    UserRole.VETERINARY_TECHNICIAN: (
+        "TEC", f"{UserRole.VETERINARY_TECHNICIAN.value}_seq"),
+}
+
+# Read-through cache for per-request user lookups (auth resolves the
+# current user on every request); entries are dropped on every write.
+# Each worker holds its own copy, so credential and status checks
+# (login, refresh, password change) bypass it with use_cache=False
+USER_CACHE_TTL_SECONDS = 30.0
+USER_CACHE_MAX_SIZE = 10_000
 
 
 class UserRepository:
@@ -42,35 +85,86 @@ class UserRepository:
         """
         self.db_service = database_service
         self.collection = database_service.users
-        self.logger = ApplicationLogger.get_logger(__name__)
+        self.logger = _LOGGER
+        # user_id -> (expires_at, User); username -> user_id
+        self._user_cache: dict[str, tuple[float, User]] = {}
+        self._username_index: dict[str, str] = {}
+
+    def _cache_get(self, user_id: str | None) -> User | None:
+        """Return a cached user if present and not expired"""
+        entry = self._user_cache.get(user_id) if user_id else None
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._invalidate_cached_user(user_id)
+            return None
+        return entry[1]
+
+    def _cache_put(self, user: User) -> None:
+        """Cache a freshly loaded user, evicting the oldest entry when full"""
+        if len(self._user_cache) >= USER_CACHE_MAX_SIZE:
+            self._invalidate_cached_user(next(iter(self._user_cache)))
+        self._user_cache[user.user_id] = (
+            time.monotonic() + USER_CACHE_TTL_SECONDS, user)
+        self._username_index[user.username] = user.user_id
+
+    def _invalidate_cached_user(self, user_id: str) -> None:
+        """Drop a user from the lookup cache after it has been modified"""
+        entry = self._user_cache.pop(user_id, None)
+        if entry is not None:
+            self._username_index.pop(entry[1].username, None)
+
+    def invalidate_cached_user(self, user_id: str) -> None:
+        """Drop a user modified elsewhere (e.g. by another worker) from the cache"""
+        self._invalidate_cached_user(user_id)
+
+    async def _find_and_cache(self, query: dict) -> User | None:
+        """Load a single user matching query and add it to the lookup cache"""
+        doc = await self.collection.find_one(query)
+        if not doc:
+            return None
+        user = User(**doc)
+        self._cache_put(user)
+        return user
 
-    async def _generate_user_id(self, role: UserRole) -> str:
+    async def _reserve_user_ids(self, role: UserRole, count: int) -> list[str]:
         """
-        Generate a sequential human-readable user ID based on role.
+        Atomically reserve a block of sequential user IDs for a role.
 
         Args:
             role: User role (VETERINARIAN or VETERINARY_TECHNICIAN)
+            count: Number of IDs to reserve
 
         Returns:
-            Generated user ID (VET-001, TEC-001, etc.)
+            Reserved user IDs in ascending order (VET-001, VET-002, ...)
         """
-        prefix = "VET" if role == UserRole.VETERINARIAN else "TEC"
-        counter_id = f"{role.value}_seq"
+        prefix, counter_id = USER_ID_SEQUENCES[role]
 
-        # Get or create sequence counter
+        # With upsert and ReturnDocument.AFTER the counter document is always returned
         counter = await self.db_service.counters.find_one_and_update(
             {"_id": counter_id},
-            {"$inc": {"seq": 1}},
+            {"$inc": {"seq": count}},
+            projection={"seq": 1},
             upsert=True,
-            return_document=True
+            return_document=ReturnDocument.AFTER
         )
 
-        if not counter:
-            # Fallback for first time
-            counter = {"seq": 1}
+        last = counter["seq"]
+        return [f"{prefix}-{sequence_number:03d}"
+                for sequence_number in range(last - count + 1, last + 1)]
 
-        sequence_number = counter["seq"]
-        return f"{prefix}-{sequence_number:03d}"
+    async def _generate_user_id(self, role: UserRole) -> str:
+        """
+        Generate a sequential human-readable user ID based on role.
+
+        Args:
+            role: User role (VETERINARIAN or VETERINARY_TECHNICIAN)
+
+        Returns:
+            Generated user ID (VET-001, TEC-001, etc.)
+        """
+        user_ids = await self._reserve_user_ids(role, 1)
+        return user_ids[0]
 
     async def create(self, user: User) -> User | None:
         """
@@ -90,49 +184,112 @@ class UserRepository:
             if not user.user_id:
                 user.user_id = await self._generate_user_id(user.role)
 
-            user.created_at = datetime.now(timezone.utc)
+            user.created_at = datetime.now(_UTC)
 
-            await self.collection.insert_one(user.model_dump(by_alias=True))
+            # Omit None fields (last_login, approved_*); reads default them
+            await self.collection.insert_one(
+                user.model_dump(by_alias=True, exclude_none=True))
 
-            self.logger.info(f"User created: {user.username} ({user.user_id})")
+            self.logger.info("User created: %s (%s)", user.username, user.user_id)
             return user
 
         except DuplicateKeyError as e:
-            if "username" in str(e):
-                self.logger.warning(f"Username exists: {user.username}")
-            elif "email" in str(e):
-                self.logger.warning(f"Email exists: {user.email}")
+            # keyPattern names the violated unique index without formatting
+            # the full server error into a string
+            key_pattern = (e.details or {}).get("keyPattern", {})
+            if "username" in key_pattern:
+                self.logger.warning("Username exists: %s", user.username)
+            elif "email" in key_pattern:
+                self.logger.warning("Email exists: %s", user.email)
             return None
         except Exception as e:
-            self.logger.error(f"User creation failed: {e}")
+            self.logger.error("User creation failed: %s", e)
             return None
 
-    async def get_by_id(self, user_id: str) -> User | None:
+    async def create_many(self, users: list[User]) -> list[User]:
+        """
+        Create several users with one counter update per role and one insert.
+
+        Args:
+            users (list[User]): Users to create
+
+        Returns:
+            list[User]: Users that were inserted; duplicates are skipped
+        """
+        if not users:
+            return []
+
+        try:
+            # Reserve IDs in one $inc per role instead of one per user
+            pending_by_role: dict[UserRole, list[User]] = {}
+            for user in users:
+                if not user.user_id:
+                    pending_by_role.setdefault(user.role, []).append(user)
+
+            for role, role_users in pending_by_role.items():
+                user_ids = await self._reserve_user_ids(role, len(role_users))
+                for user, user_id in zip(role_users, user_ids):
+                    user.user_id = user_id
+
+            now = datetime.now(_UTC)
+            for user in users:
+                user.created_at = now
+
+            await self.collection.insert_many(
+                [user.model_dump(by_alias=True, exclude_none=True)
+                 for user in users],
+                ordered=False
+            )
+
+            self.logger.info("Created %s users", len(users))
+            return users
+
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details.get("writeErrors", [])}
+            created = [user for index, user in enumerate(users)
+                       if index not in failed]
+            self.logger.warning(
+                "Created %s of %s users; %s rejected", len(created), len(users), len(failed))
+            return created
+        except Exception as e:
+            self.logger.error("Bulk user creation failed: %s", e)
+            return []
+
+    async def get_by_id(self, user_id: str, use_cache: bool = True) -> User | None:
         """
         Retrieve user by human-readable ID.
 
         Args:
             user_id (str): User ID to search for (e.g., VET-001, TEC-001)
+            use_cache (bool): Whether a cached copy may be returned; pass
+                False when checking the password hash or account status
 
         Returns:
             User | None: User object if found, None otherwise
         """
+        cached = self._cache_get(user_id) if use_cache else None
+        if cached is not None:
+            return cached
+
         try:
-            doc = await self.collection.find_one({"_id": user_id})
-            return User(**doc) if doc else None
+            return await self._find_and_cache({"_id": user_id})
 
         except Exception as e:
-            self.logger.error(f"Error retrieving user by ID: {e}")
+            self.logger.error("Error retrieving user by ID: %s", e)
             return None
 
-    async def get_by_username(self, username: str) -> User | None:
-        """Get user by username"""
+    async def get_by_username(self, username: str, use_cache: bool = True) -> User | None:
+        """Get user by username; use_cache=False always reads the database"""
+        cached = self._cache_get(
+            self._username_index.get(username)) if use_cache else None
+        if cached is not None:
+            return cached
+
         try:
-            doc = await self.collection.find_one({"username": username})
-            return User(**doc) if doc else None
+            return await self._find_and_cache({"username": username})
 
         except Exception as e:
-            self.logger.error(f"Error getting user by username: {e}")
+            self.logger.error("Error getting user by username: %s", e)
             return None
 
     async def get_by_email(self, email: str) -> User | None:
@@ -142,40 +299,126 @@ class UserRepository:
             return User(**doc) if doc else None
 
         except Exception as e:
-            self.logger.error(f"Error getting user by email: {e}")
+            self.logger.error("Error getting user by email: %s", e)
             return None
 
-    async def get_all(self) -> List[User]:
-        """Get all users"""
+    async def _find_list_page(
+        self,
+        query: dict,
+        limit: int,
+        cursor: str | None
+    ) -> tuple[List[UserListView], str | None]:
+        """
+        Fetch one keyset page of users, newest first.
+
+        Args:
+            query: Base filter for the listing
+            limit: Maximum number of users to return
+            cursor: next_cursor of the previous page, or None for the first page
+
+        Returns:
+            tuple[List[UserListView], str | None]: At most `limit` users and the
+            cursor of the next page (None on the last page)
+        """
+        if cursor is not None:
+            query = {**query, **page_after_filter(cursor)}
+
+        docs = await self.collection.find(query, USER_LIST_PROJECTION) \
+            .sort(NEWEST_FIRST_SORT).limit(limit + 1) \
+            .batch_size(LIST_BATCH_SIZE).to_list(length=limit + 1)
+        # The extra document only signals that another page exists.
+        # Documents were validated on write; skip re-validation for bulk reads
+        users = [UserListView.model_construct(**doc) for doc in docs[:limit]]
+        last = users[-1] if len(docs) > limit else None
+        next_cursor = (encode_page_cursor(last.created_at, last.user_id)
+                       if last is not None else None)
+        return users, next_cursor
+
+    async def exists_username_or_email(self, username: str, email: str) -> tuple[bool, bool]:
+        """
+        Check whether a username or email is already taken.
+
+        Uses a single $or query (served by the username and email indexes)
+        and only fetches the two fields needed to tell which one collided.
+        At most two documents can match: one per unique field.
+
+        Args:
+            username: Username to check
+            email: Email to check
+
+        Returns:
+            tuple[bool, bool]: (username_taken, email_taken)
+        """
+        cursor = self.collection.find(
+            {"$or": [{"username": username}, {"email": email}]},
+            {"username": 1, "email": 1}
+        ).limit(2)
+
+        username_taken = email_taken = False
+        async for doc in cursor:
+            username_taken = username_taken or doc.get("username") == username
+            email_taken = email_taken or doc.get("email") == email
+        return username_taken, email_taken
+
+    async def get_all(
+        self,
+        limit: int = DEFAULT_LIST_LIMIT,
+        cursor: str | None = None
+    ) -> tuple[List[UserListView], str | None]:
+        """
+        Get a page of all users (list view fields only).
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
         try:
-            cursor = self.collection.find({}).sort("created_at", -1)
-            docs = await cursor.to_list(length=None)
-            return [User(**doc) for doc in docs]
+            return await self._find_list_page({}, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error getting all users: {e}")
-            return []
+            self.logger.error("Error getting all users: %s", e)
+            return [], None
+
+    async def get_by_role(
+        self,
+        role: UserRole,
+        limit: int = DEFAULT_LIST_LIMIT,
+        cursor: str | None = None
+    ) -> tuple[List[UserListView], str | None]:
+        """
+        Get a page of users by role (list view fields only).
 
-    async def get_by_role(self, role: UserRole) -> List[User]:
-        """Get users by role"""
+        Raises:
+            ValueError: If the cursor is malformed
+        """
         try:
-            cursor = self.collection.find(
-                {"role": role}).sort("created_at", -1)
-            docs = await cursor.to_list(length=None)
-            return [User(**doc) for doc in docs]
+            return await self._find_list_page({"role": role}, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error getting users by role: {e}")
-            return []
+            self.logger.error("Error getting users by role: %s", e)
+            return [], None
 
-    async def get_by_approval_status(self, status: ApprovalStatus) -> List[User]:
-        """Get users by approval status"""
+    async def get_by_approval_status(
+        self,
+        status: ApprovalStatus,
+        limit: int = DEFAULT_LIST_LIMIT,
+        cursor: str | None = None
+    ) -> tuple[List[UserListView], str | None]:
+        """
+        Get a page of users by approval status (list view fields only).
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
         try:
-            cursor = self.collection.find(
-                {"approval_status": status}).sort("created_at", -1)
-            docs = await cursor.to_list(length=None)
-            return [User(**doc) for doc in docs]
+            return await self._find_list_page(
+                {"approval_status": status}, limit, cursor)
+        except ValueError:
+            raise
         except Exception as e:
-            self.logger.error(f"Error getting users by approval status: {e}")
-            return []
+            self.logger.error("Error getting users by approval status: %s", e)
+            return [], None
 
     async def update_profile(self, user_id: str, profile_data: dict) -> bool:
         """
@@ -186,68 +429,63 @@ class UserRepository:
             profile_data: Profile data to update
         """
         try:
-            # Extract email if present
-            email = None
-            if 'email' in profile_data:
-                email = profile_data.pop('email')
-
-            # Prepare update data
-            update_data = {}
-
-            # Add profile fields if any remain
-            if profile_data:
-                # Update individual profile fields instead of replacing the whole profile
-                profile_updates = {
-                    f"profile.{key}": value for key, value in profile_data.items()}
-                update_data.update(profile_updates)
-
-            # Add email if present
-            if email:
-                update_data["email"] = email
+            # Update individual profile fields via dotted paths instead of
+            # replacing the whole profile; email lives at the top level.
+            # Everything goes into a single $set so there is only one write.
+            # None values are skipped so they never clobber stored fields.
+            update_data = {
+                f"profile.{key}": value
+                for key, value in profile_data.items()
+                if key != "email" and value is not None
+            }
+            if profile_data.get("email"):
+                update_data["email"] = profile_data["email"]
 
             # Only update if we have data to update
             if not update_data:
                 return False
 
             self.logger.info(
-                f"Updating profile for user: {user_id} with data: {update_data}")
+                "Updating profile for user: %s with data: %s", user_id, update_data)
 
             result = await self.collection.update_one(
                 {"_id": user_id},  # Use _id instead of user_id
                 {"$set": update_data}
             )
+            self._invalidate_cached_user(user_id)
 
             if result.matched_count > 0:
-                self.logger.info(f"Updated profile for user: {user_id}")
+                self.logger.info("Updated profile for user: %s", user_id)
                 return True
             else:
                 self.logger.warning(
-                    f"User not found for profile update: {user_id}")
+                    "User not found for profile update: %s", user_id)
                 return False
 
         except Exception as e:
-            self.logger.error(f"Error updating user profile: {e}")
+            self.logger.error("Error updating user profile: %s", e)
             return False
 
     async def update_password(self, user_id: str, hashed_password: str) -> bool:
         """Update user password"""
         try:
-            self.logger.info(f"Updating password for user: {user_id}")
+            self.logger.info("Updating password for user: %s", user_id)
 
             result = await self.collection.update_one(
                 {"_id": user_id},  # Use _id instead of user_id
                 {"$set": {"hashed_password": hashed_password}}
             )
+            self._invalidate_cached_user(user_id)
 
             if result.matched_count > 0:
-                self.logger.info(f"Updated password for user: {user_id}")
+                self.logger.info("Updated password for user: %s", user_id)
                 return True
             else:
                 self.logger.warning(
-                    f"User not found for password update: {user_id}")
+                    "User not found for password update: %s", user_id)
                 return False
         except Exception as e:
-            self.logger.error(f"Error updating user password: {e}")
+            self.logger.error("Error updating user password: %s", e)
             return False
 
     async def update_last_login(self, user_id: str) -> bool:
@@ -259,14 +497,15 @@ class UserRepository:
         """
         try:
             result = await self.collection.update_one(
-                {"user_id": user_id},
-                {"$set": {"last_login": datetime.now(timezone.utc)}}
+                {"_id": user_id},
+                {"$set": {"last_login": datetime.now(_UTC)}}
             )
+            self._invalidate_cached_user(user_id)
 
             return result.modified_count > 0
 
         except Exception as e:
-            self.logger.error(f"Error updating last login: {e}")
+            self.logger.error("Error updating last login: %s", e)
             return False
 
     async def update_approval_status(
@@ -282,22 +521,58 @@ class UserRepository:
 
             if status == ApprovalStatus.APPROVED and approved_by is not None:
                 update_data["approved_by"] = approved_by
-                update_data["approved_at"] = datetime.now(timezone.utc)
+                update_data["approved_at"] = datetime.now(_UTC)
 
             result = await self.collection.update_one(
-                {"user_id": user_id},
+                {"_id": user_id},
                 {"$set": update_data}
             )
+            self._invalidate_cached_user(user_id)
 
             if result.modified_count > 0:
                 self.logger.info(
-                    f"Updated approval status for user: {user_id} to {status}")
+                    "Updated approval status for user: %s to %s", user_id, status)
                 return True
             return False
         except Exception as e:
-            self.logger.error(f"Error updating approval status: {e}")
+            self.logger.error("Error updating approval status: %s", e)
             return False
 
+    async def bulk_approve(self, user_ids: list[str], approved_by: str) -> int:
+        """
+        Approve several users in a single round trip.
+
+        Args:
+            user_ids: User IDs to approve (e.g., VET-001)
+            approved_by: Admin ID performing the approval
+
+        Returns:
+            int: Number of users whose status changed
+        """
+        if not user_ids:
+            return 0
+
+        try:
+            update = {"$set": {
+                "approval_status": ApprovalStatus.APPROVED,
+                "approved_by": approved_by,
+                "approved_at": datetime.now(_UTC)
+            }}
+            operations = [UpdateOne({"_id": user_id}, update)
+                          for user_id in user_ids]
+            result = await self.collection.bulk_write(operations, ordered=False)
+            for user_id in user_ids:
+                self._invalidate_cached_user(user_id)
+
+            self.logger.info(
+                "Approved %s of %s users by %s",
+                result.modified_count, len(user_ids), approved_by)
+            return result.modified_count
+
+        except Exception as e:
+            self.logger.error("Error bulk approving users: %s", e)
+            return 0
+
     async def deactivate(self, user_id: str) -> bool:
         """
         Deactivate a user with human-readable ID.
@@ -307,31 +582,33 @@ class UserRepository:
         """
         try:
             result = await self.collection.update_one(
-                {"user_id": user_id},
+                {"_id": user_id},
                 {"$set": {"is_active": False}}
             )
+            self._invalidate_cached_user(user_id)
 
             if result.modified_count > 0:
-                self.logger.info(f"Deactivated user: {user_id}")
+                self.logger.info("Deactivated user: %s", user_id)
                 return True
             return False
 
         except Exception as e:
-            self.logger.error(f"Error deactivating user: {e}")
+            self.logger.error("Error deactivating user: %s", e)
             return False
 
     async def reactivate(self, user_id: str) -> bool:
         """Reactivate a user account"""
         try:
             result = await self.collection.update_one(
-                {"user_id": user_id},
+                {"_id": user_id},
                 {"$set": {"is_active": True}}
             )
+            self._invalidate_cached_user(user_id)
 
             if result.modified_count > 0:
-                self.logger.info(f"Reactivated user: {user_id}")
+                self.logger.info("Reactivated user: %s", user_id)
                 return True
             return False
         except Exception as e:
-            self.logger.error(f"Error reactivating user: {e}")
+            self.logger.error("Error reactivating user: %s", e)
             return False
@@ -13,7 +13,11 @@ from typing import Union
 
 from app.dependencies.auth_dependencies import require_authenticated
 from app.models.database_models import Admin, User
-from app.services.pdf_analysis_service import BloodworkPdfAnalysisService
+from app.schemas.diagnostic_schemas import AnalysisInProgressResponse
+from app.services.pdf_analysis_service import (
+    BloodworkPdfAnalysisService,
+    get_pdf_analysis_service,
+)
 from app.utils.logger_utils import ApplicationLogger
 from fastapi import (
     APIRouter,
@@ -21,10 +25,11 @@ from fastapi import (
     Depends,
     File,
     Form,
-    HTTPException,
+    Path,
+    Request,
     UploadFile,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 
 class AnalysisRouter:
@@ -39,8 +44,11 @@ class AnalysisRouter:
     def __init__(self):
         """Initialize the analysis router with required dependencies."""
         self._logger = ApplicationLogger.get_logger("analysis_router")
-        self._router = APIRouter(prefix="/api/v1/analysis", tags=["Analysis"])
-        self._pdf_analysis_service = BloodworkPdfAnalysisService()
+        self._router = APIRouter(
+            prefix="/api/v1/analysis",
+            tags=["Analysis"],
+            default_response_class=ORJSONResponse
+        )
         self._setup_routes()
 
     def _setup_routes(self) -> None:
@@ -49,17 +57,27 @@ class AnalysisRouter:
             "/upload",
             self.upload_pdf_for_analysis,
             methods=["POST"],
+            status_code=202,
             summary="Upload PDF for analysis",
             description="Upload a PDF bloodwork report for AI-powered analysis"
         )
+        self._router.add_api_route(
+            "/{diagnostic_id}/result",
+            self.get_analysis_result,
+            methods=["GET"],
+            summary="Get analysis result",
+            description="Poll for the AI analysis result of an uploaded report"
+        )
 
     async def upload_pdf_for_analysis(
         self,
+        background_tasks: BackgroundTasks,
         file: UploadFile = File(...),
         patient_id: str = Form(...),
-        background_tasks: BackgroundTasks = BackgroundTasks(),
-        current_user: Union[Admin, User] = Depends(require_authenticated)
-    ) -> JSONResponse:
+        current_user: Union[Admin, User] = Depends(require_authenticated),
+        pdf_analysis_service: BloodworkPdfAnalysisService = Depends(
+            get_pdf_analysis_service)
+    ) -> ORJSONResponse:
         """
         Endpoint to analyze uploaded PDF bloodwork files.
 
@@ -68,13 +86,15 @@ class AnalysisRouter:
         a diagnostic ID for tracking the analysis progress.
 
         Args:
+            background_tasks (BackgroundTasks): FastAPI background task manager
             file (UploadFile): The uploaded PDF file
             patient_id (str): The patient ID to link the analysis to
-            background_tasks (BackgroundTasks): FastAPI background task manager
             current_user (User): Authenticated user from JWT token
+            pdf_analysis_service (BloodworkPdfAnalysisService): Shared analysis service
 
         Returns:
-            JSONResponse: Response with diagnostic ID and status message
+            ORJSONResponse: 202 response with diagnostic ID and status message;
+                the Location header points at the result endpoint
 
         Raises:
             HTTPException: If file validation or processing fails
@@ -89,55 +109,85 @@ class AnalysisRouter:
                 "message": "Analysis in progress. Check results later."
             }
         """
-        self._logger.info(f"Received PDF analysis request: {file.filename}")
-        self._logger.info(f"Current user: {current_user}")
-        self._logger.info(f"Patient ID: {patient_id}")
+        self._logger.info("Received PDF analysis request: %s", file.filename)
+        self._logger.info("Current user: %s (role: %s)",
+                          current_user.username, current_user.role)
+        self._logger.info("Patient ID: %s", patient_id)
+
+        # Validate file type
+        await pdf_analysis_service._validate_uploaded_file(file)
+
+        # Process the PDF file; the service maps its own failures to
+        # HTTPException and anything unexpected reaches the app-wide handler
+        result = await pdf_analysis_service.process_uploaded_pdf_in_background(
+            file, patient_id, background_tasks, current_user
+        )
 
-        try:
-            # Validate file type
-            self._pdf_analysis_service._validate_uploaded_file(file)
+        self._logger.info(
+            "PDF analysis initiated successfully for: %s (ID: %s, Patient: %s)",
+            file.filename, result["diagnostic_id"], patient_id
+        )
 
-            # Process the PDF file
-            result = await self._pdf_analysis_service.process_uploaded_pdf_in_background(
-                file, patient_id, background_tasks, current_user
-            )
+        # 202 + Location lets clients poll the result endpoint directly
+        return ORJSONResponse(
+            content=result,
+            status_code=202,
+            headers={
+                "Location": f"{self._router.prefix}/{result['diagnostic_id']}/result",
+                "Retry-After": "5"
+            }
+        )
+
+    async def get_analysis_result(
+        self,
+        request: Request,
+        diagnostic_id: str = Path(..., description="Diagnostic ID to poll"),
+        current_user: Union[Admin, User] = Depends(require_authenticated),
+        pdf_analysis_service: BloodworkPdfAnalysisService = Depends(
+            get_pdf_analysis_service)
+    ) -> Response:
+        """
+        Endpoint to poll for the result of a bloodwork analysis.
+
+        Completed results carry a strong ETag; clients that send it back in
+        If-None-Match get an empty 304 instead of the full document.
 
-            self._logger.info(
-                f"PDF analysis initiated successfully for: {file.filename} "
-                f"(ID: {result['diagnostic_id']}, Patient: {patient_id})"
+        Args:
+            request (Request): Incoming request (for If-None-Match)
+            diagnostic_id (str): The diagnostic ID returned by the upload
+            current_user (User): Authenticated user from JWT token
+            pdf_analysis_service (BloodworkPdfAnalysisService): Shared analysis service
+
+        Returns:
+            Response: 200 with the analysis JSON, 202 while it is still
+                in progress, or 304 if the client copy is current
+
+        Raises:
+            HTTPException: 404 if the diagnostic does not exist, 422 with
+                the stored error if the analysis failed, 500 if the lookup
+                itself failed
+        """
+        encoded = await pdf_analysis_service.get_encoded_analysis_result(
+            diagnostic_id)
+
+        if encoded is None:
+            return ORJSONResponse(
+                status_code=202,
+                content=AnalysisInProgressResponse().model_dump(mode="json")
             )
 
-            return JSONResponse(content=result)
-
-        except HTTPException:
-            # Re-raise HTTP exceptions without modification
-            raise
-
-        except Exception as error:
-            error_msg = f"Unexpected error during PDF analysis: {error}"
-            self._logger.exception(error_msg)
-            raise HTTPException(
-                status_code=500,
-                detail=f"Internal server error: {str(error)}"
-            ) from error
-
-    # def _validate_pdf_file(self, file: UploadFile) -> None:
-    #     """
-    #     Validate the uploaded file is a PDF.
-
-    #     Args:
-    #         file (UploadFile): File to validate
-
-    #     Raises:
-    #         HTTPException: If file is not a valid PDF
-    #     """
-    #     if file.content_type != "application/pdf":
-    #         error_msg = f"Rejected upload: unsupported content type: {file.content_type}"
-    #         self._logger.error(error_msg)
-    #         raise HTTPException(
-    #             status_code=400,
-    #             detail="Only PDF files are accepted."
-    #         )
+        # Pre-encoded bytes are sent as-is; no per-poll serialization
+        body, etag = encoded
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=5"}
+
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers=headers
+        )
 
     def get_router(self) -> APIRouter:
         """
@@ -149,6 +199,14 @@ class AnalysisRouter:
         return self._router
 
 
-# Legacy compatibility - create a router instance for backward compatibility
-analysis_router_instance = AnalysisRouter()
-router = analysis_router_instance.get_router()
+def build_router() -> APIRouter:
+    """
+    Build the analysis APIRouter.
+
+    Called once from main.py when routers are registered, instead of
+    constructing a router instance as a side effect of importing this module.
+
+    Returns:
+        APIRouter: The configured router with all endpoints
+    """
+    return AnalysisRouter().get_router()
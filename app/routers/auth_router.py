@@ -17,11 +17,18 @@ Last updated: 2025-06-20
 Author: Bedirhan Gilgiler
 """
 
-from typing import Union
-
-from app.auth.auth_service import AuthService
-from app.dependencies.auth_dependencies import get_auth_service, require_authenticated
-from app.models.database_models import Admin, ApprovalStatus, User, UserRole
+import hashlib
+import hmac
+import random
+import secrets
+import time
+
+from app.auth.auth_service import AuthService, LoginFailure
+from app.dependencies.auth_dependencies import (
+    AuthenticatedPrincipal,
+    get_auth_service,
+    get_authenticated_principal,
+)
 from app.schemas.auth_schemas import (
     AccessTokenResponse,
     PasswordChangeRequest,
@@ -33,14 +40,85 @@ from app.schemas.auth_schemas import (
     UserRegistration,
 )
 from app.utils.logger_utils import ApplicationLogger
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from fastapi.security import HTTPBearer
-
-# Initialize router and security components
-router = APIRouter(prefix="/api/v1/auth", tags=["Authentication"])
-security = HTTPBearer()
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
+
+# Initialize router
+router = APIRouter(
+    prefix="/api/v1/auth",
+    tags=["Authentication"],
+    default_response_class=ORJSONResponse
+)
 logger = ApplicationLogger.get_logger("auth_router")
 
+# Recently rejected (username, password) pairs, so repeated bad credentials
+# are refused without another lookup and bcrypt verify. Only pairs whose
+# password verification failed are kept, as a truncated HMAC-SHA256 under a
+# random per-process key, so a memory dump cannot be brute-forced offline
+# into the passwords users mistyped.
+FAILED_LOGIN_TTL_SECONDS = 60.0
+FAILED_LOGIN_MAX_USERS = 50_000
+FAILED_LOGIN_MAX_PER_USER = 32
+_failed_logins: dict[str, dict[bytes, float]] = {}
+_FAILED_LOGIN_KEY = secrets.token_bytes(32)
+
+
+def _password_digest(password: str) -> bytes:
+    return hmac.new(_FAILED_LOGIN_KEY, password.encode(),
+                    hashlib.sha256).digest()[:16]
+
+
+def _is_recent_failed_login(username: str, digest: bytes) -> bool:
+    """Whether this exact username/password pair failed within the TTL."""
+    expires_at = _failed_logins.get(username, {}).get(digest)
+    return expires_at is not None and expires_at >= time.monotonic()
+
+
+def _remember_failed_login(username: str, digest: bytes) -> None:
+    """Record a rejected pair; TTL is jittered so entries don't expire in lockstep."""
+    attempts = _failed_logins.get(username)
+    if attempts is None:
+        if len(_failed_logins) >= FAILED_LOGIN_MAX_USERS:
+            _failed_logins.pop(next(iter(_failed_logins)))
+        attempts = _failed_logins[username] = {}
+    elif digest not in attempts and len(attempts) >= FAILED_LOGIN_MAX_PER_USER:
+        attempts.pop(next(iter(attempts)))
+    attempts[digest] = time.monotonic() + FAILED_LOGIN_TTL_SECONDS * \
+        random.uniform(0.75, 1.0)
+
+
+# Encoded /profile bodies per (account type, ID). Each entry remembers the
+# account model it was built from and is reused only while the principal
+# still resolves to that same instance, so a body is never staler than the
+# token and user caches that produced the principal.
+PROFILE_CACHE_TTL_SECONDS = 30.0
+PROFILE_CACHE_MAX_SIZE = 10_000
+_profile_cache: dict[tuple[str, str], tuple[float, object, bytes]] = {}
+
+
+def _profile_cache_key(principal: AuthenticatedPrincipal) -> tuple[str, str]:
+    """Cache key for a user's profile body."""
+    return (principal.kind, principal.user_id)
+
+
+def _get_profile_body(principal: AuthenticatedPrincipal) -> bytes:
+    """Return the encoded /profile body, building it on a cache miss."""
+    key = _profile_cache_key(principal)
+    entry = _profile_cache.get(key)
+    if (entry is not None and entry[1] is principal.raw
+            and entry[0] >= time.monotonic()):
+        return entry[2]
+
+    # Every field comes from an already validated model and the principal's
+    # normalized enums, so validation is skipped
+    body = UserProfile.model_construct(
+        **principal.as_profile_dict()).model_dump_json().encode()
+    if key not in _profile_cache and len(_profile_cache) >= PROFILE_CACHE_MAX_SIZE:
+        _profile_cache.pop(next(iter(_profile_cache)))
+    _profile_cache[key] = (
+        time.monotonic() + PROFILE_CACHE_TTL_SECONDS, principal.raw, body)
+    return body
+
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 async def register(
@@ -72,7 +150,7 @@ async def register(
             "role": "veterinarian"
         }
     """
-    logger.info(f"User registration attempt: {user_data.username}")
+    logger.info("User registration attempt: %s", user_data.username)
 
     user = await auth_service.register_user(
         username=user_data.username,
@@ -84,14 +162,14 @@ async def register(
 
     if not user:
         logger.warning(
-            f"Registration failed: {user_data.username} - username/email exists")
+            "Registration failed: %s - username/email exists", user_data.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username or email already exists"
         )
 
     logger.info(
-        f"User registered successfully: {user.username} (ID: {user.user_id})")
+        "User registered successfully: %s (ID: %s)", user.username, user.user_id)
 
     return {
         "message": "User registered successfully. Awaiting admin approval.",
@@ -130,31 +208,51 @@ async def login(
             "password": "secure_password"
         }
     """
-    logger.info(f"Login attempt: {user_data.username}")
+    logger.info("Login attempt: %s", user_data.username)
+
+    password_digest = _password_digest(user_data.password)
+    if _is_recent_failed_login(user_data.username, password_digest):
+        logger.warning(
+            "Login refused: %s - repeated invalid credentials", user_data.username)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials or account not approved"
+        )
 
-    # Extract client info for refresh token tracking
-    device_info = request.headers.get("user-agent", "Unknown")
-    ip_address = request.client.host if request.client else None
+    # Extract client info for refresh token tracking, straight from the
+    # ASGI scope rather than through the Headers/Address wrappers
+    scope = request.scope
+    device_info = next(
+        (value.decode("latin-1") for key, value in scope["headers"]
+         if key == b"user-agent"),
+        "Unknown"
+    )
+    client = scope.get("client")
+    ip_address = client[0] if client else None
 
-    logger.info(f"Login from device: {device_info}, IP: {ip_address}")
+    logger.debug("Login from device: %s, IP: %s", device_info, ip_address)
 
-    tokens = await auth_service.login(
+    result = await auth_service.login(
         username=user_data.username,
         password=user_data.password,
         device_info=device_info,
         ip_address=ip_address
     )
 
-    if not tokens:
-        logger.warning(
-            f"Login failed: {user_data.username} - invalid credentials or not approved")
+    if isinstance(result, LoginFailure):
+        logger.warning("Login failed: %s - %s", user_data.username, result.value)
+        # Only a wrong password is certain to fail again; lookup errors and
+        # account status can change at any moment
+        if result is LoginFailure.INVALID_PASSWORD:
+            _remember_failed_login(user_data.username, password_digest)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials or account not approved"
         )
 
-    logger.info(f"Login successful: {user_data.username}")
-    return tokens
+    _failed_logins.pop(user_data.username, None)
+    logger.info("Login successful: %s", user_data.username)
+    return result
 
 
 @router.post("/refresh", response_model=AccessTokenResponse)
@@ -243,7 +341,9 @@ async def logout(
 
 
 @router.get("/profile", response_model=UserProfile)
-async def get_profile(current_user: Union[Admin, User] = Depends(require_authenticated)):
+async def get_profile(
+    principal: AuthenticatedPrincipal = Depends(get_authenticated_principal)
+):
     """
     Get authenticated user's profile information.
 
@@ -251,7 +351,7 @@ async def get_profile(current_user: Union[Admin, User] = Depends(require_authent
     approval status, and custom profile fields.
 
     Args:
-        current_user (User): Current authenticated user
+        principal (AuthenticatedPrincipal): Current authenticated user
 
     Returns:
         UserProfile: User profile information
@@ -266,44 +366,16 @@ async def get_profile(current_user: Union[Admin, User] = Depends(require_authent
             ...
         }
     """
-    logger.info(f"Profile requested by {current_user.username}")
-
-    # Extract the appropriate ID based on user type
-    from app.models.database_models import Admin
-    if isinstance(current_user, Admin):
-        user_id = current_user.admin_id
-        # Admin has fixed role
-        role = UserRole.VETERINARIAN if current_user.role == "veterinarian" else UserRole.VETERINARY_TECHNICIAN
-        # Admins don't have approval status, set as approved by default
-        approval_status = ApprovalStatus.APPROVED
-    else:  # User
-        user_id = current_user.user_id
-        # Ensure role is proper enum type
-        role = current_user.role if isinstance(
-            current_user.role, UserRole) else UserRole(current_user.role)
-        # Ensure approval status is proper enum type
-        status_value = getattr(
-            current_user, 'approval_status', ApprovalStatus.PENDING)
-        approval_status = status_value if isinstance(
-            status_value, ApprovalStatus) else ApprovalStatus(status_value)
-
-    return UserProfile(
-        user_id=user_id,
-        username=current_user.username,
-        email=current_user.email,
-        role=role,
-        approval_status=approval_status,
-        profile=current_user.profile,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at,
-        last_login=current_user.last_login
-    )
+    logger.info("Profile requested by %s", principal.username)
+
+    return Response(content=_get_profile_body(principal),
+                    media_type="application/json")
 
 
 @router.put("/profile")
 async def update_profile(
     profile_data: UserProfileUpdate,
-    current_user: Union[Admin, User] = Depends(require_authenticated),
+    principal: AuthenticatedPrincipal = Depends(get_authenticated_principal),
     auth_service: AuthService = Depends(get_auth_service)
 ):
     """
@@ -314,7 +386,7 @@ async def update_profile(
 
     Args:
         profile_data (UserProfileUpdate): Profile fields to update
-        current_user (Union[Admin, User]): Authenticated user
+        principal (AuthenticatedPrincipal): Authenticated user
         auth_service (AuthService): Authentication service instance
 
     Returns:
@@ -331,49 +403,47 @@ async def update_profile(
             "last_name": "Doe"
         }
     """
-    logger.info(f"Profile update request for user: {current_user.username}")
+    logger.info("Profile update request for user: %s", principal.username)
 
-    # Get user ID based on user type
-    from app.models.database_models import Admin
-    if isinstance(current_user, Admin):
-        user_id = current_user.admin_id
-        repo = auth_service.admin_repo
-    else:
-        user_id = current_user.user_id
-        repo = auth_service.user_repo
-
-    # Convert profile data to dictionary, excluding None values
-    profile_dict = {k: v for k,
-                    v in profile_data.model_dump().items() if v is not None}
+    # Convert profile data to dictionary, excluding unset and None values;
+    # an empty body is rejected without serializing the model at all
+    profile_dict = None
+    if profile_data.model_fields_set:
+        profile_dict = profile_data.model_dump(
+            exclude_unset=True, exclude_none=True)
 
     if not profile_dict:
         logger.warning(
-            f"Profile update failed: no data provided for {current_user.username}")
+            "Profile update failed: no data provided for %s", principal.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No profile data provided"
         )
 
     # Update profile
-    success = await repo.update_profile(user_id, profile_dict)
+    success = await principal.repo.update_profile(principal.user_id, profile_dict)
 
     if not success:
         logger.error(
-            f"Profile update failed for user: {current_user.username}")
+            "Profile update failed for user: %s", principal.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Profile update failed"
         )
 
+    # The cached principal (here and in other workers) still holds the old
+    # account; evict it so the next request, and its profile body, reload
+    await auth_service.revoke_cached_tokens(principal.user_id)
+    _profile_cache.pop(_profile_cache_key(principal), None)
     logger.info(
-        f"Profile updated successfully for user: {current_user.username}")
+        "Profile updated successfully for user: %s", principal.username)
     return {"message": "Profile updated successfully"}
 
 
 @router.put("/password")
 async def change_password(
     password_data: PasswordChangeRequest,
-    current_user: Union[Admin, User] = Depends(require_authenticated),
+    principal: AuthenticatedPrincipal = Depends(get_authenticated_principal),
     auth_service: AuthService = Depends(get_auth_service)
 ):
     """
@@ -384,7 +454,7 @@ async def change_password(
 
     Args:
         password_data (PasswordChangeRequest): Password change request data
-        current_user (Union[Admin, User]): Authenticated user
+        principal (AuthenticatedPrincipal): Authenticated user
         auth_service (AuthService): Authentication service instance
 
     Returns:
@@ -403,41 +473,57 @@ async def change_password(
             "confirm_password": "new_secure_password"
         }
     """
-    logger.info(f"Password change request for user: {current_user.username}")
+    logger.info("Password change request for user: %s", principal.username)
 
     # Validate password confirmation
     if password_data.new_password != password_data.confirm_password:
         logger.warning(
-            f"Password change failed: passwords don't match for {current_user.username}")
+            "Password change failed: passwords don't match for %s", principal.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="New password and confirmation do not match"
         )
 
-    # Get user ID based on user type
-    from app.models.database_models import Admin
-    if isinstance(current_user, Admin):
-        user_id = current_user.admin_id
-    else:
-        user_id = current_user.user_id
+    # Refuse requests that cannot succeed before paying for two bcrypt rounds
+    if password_data.new_password == password_data.current_password:
+        logger.warning(
+            "Password change failed: new password unchanged for %s", principal.username)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="New password must differ from the current password"
+        )
+
+    if len(password_data.new_password) < auth_service.config.password_min_length:
+        logger.warning(
+            "Password change failed: new password too short for %s", principal.username)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="New password is too short"
+        )
 
     # Change password using auth service
     success = await auth_service.change_password(
-        user_id=user_id,
+        user_id=principal.user_id,
         current_password=password_data.current_password,
-        new_password=password_data.new_password
+        new_password=password_data.new_password,
+        kind=principal.kind
     )
 
     if not success:
         logger.warning(
-            f"Password change failed for user: {current_user.username}")
+            "Password change failed for user: %s", principal.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect or new password is too weak"
         )
 
+    # change_password already evicted the cached principal, which carries
+    # the old password hash, in every worker
+    _profile_cache.pop(_profile_cache_key(principal), None)
+    # A password refused before the change may be the new one
+    _failed_logins.pop(principal.username, None)
     logger.info(
-        f"Password changed successfully for user: {current_user.username}")
+        "Password changed successfully for user: %s", principal.username)
     return {"message": "Password changed successfully"}
 
 
@@ -12,26 +12,66 @@ Author: Bedirhan Gilgiler
 from typing import Union
 
 from app.dependencies.auth_dependencies import (
+    get_access_token_claims,
     get_repository_factory,
     require_authenticated,
 )
-from app.models.database_models import Admin, User
+from app.models.database_models import Admin, AiDiagnostic, User
 from app.repositories import RepositoryFactory
 from app.schemas.diagnostic_schemas import DiagnosticListResponse, DiagnosticResponse
 from app.services.pdf_analysis_service import PENDING_ANALYSIS_REQUESTS
 from app.utils.logger_utils import ApplicationLogger
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
+from fastapi.responses import ORJSONResponse
 
 # Initialize router and logger
-router = APIRouter(prefix="/api/v1/diagnostics", tags=["Diagnostics"])
+router = APIRouter(
+    prefix="/api/v1/diagnostics",
+    tags=["Diagnostics"],
+    default_response_class=ORJSONResponse
+)
 logger = ApplicationLogger.get_logger("diagnostic_router")
 
 
+def _to_diagnostic_response(diagnostic: AiDiagnostic) -> DiagnosticResponse:
+    """
+    Build the response for a diagnostic loaded from the database.
+
+    The AiDiagnostic model has already validated every field, so the
+    response is constructed without validating it again. Routes returning
+    it declare their schema through ``responses=`` rather than
+    ``response_model=``, which would re-validate the returned model.
+    """
+    return DiagnosticResponse.model_construct(
+        diagnostic_id=diagnostic.diagnostic_id,
+        patient_id=diagnostic.patient_id,
+        sequence_number=diagnostic.sequence_number,
+        test_date=diagnostic.test_date,
+        diagnostic_summary=diagnostic.diagnostic_summary,
+        ai_diagnostic=diagnostic.ai_diagnostic,
+        pdf_metadata=diagnostic.pdf_metadata,
+        processing_info=diagnostic.processing_info,
+        veterinarian_review=diagnostic.veterinarian_review,
+        created_by=diagnostic.created_by,
+        created_at=diagnostic.created_at
+    )
+
+
+async def _ensure_patient_exists(repo_factory: RepositoryFactory, patient_id: str) -> None:
+    """Raise 404 if the patient does not exist."""
+    if not await repo_factory.patient_repository.exists(patient_id):
+        logger.warning("Patient not found: %s", patient_id)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Patient not found: {patient_id}"
+        )
+
+
 @router.get("/patient/{patient_id}/pending", response_model=dict)
 async def check_pending_analysis(
     patient_id: str = Path(...,
                            description="Patient ID to check for pending analysis"),
-    current_user: Union[Admin, User] = Depends(require_authenticated),
+    claims: dict = Depends(get_access_token_claims),
 ):
     """
     Check if a patient has a pending analysis request.
@@ -40,7 +80,7 @@ async def check_pending_analysis(
 
     Args:
         patient_id (str): Patient ID to check
-        current_user (Union[Admin, User]): Authenticated user
+        claims (dict): Verified access token claims (no account lookup needed)
 
     Returns:
         dict: Dictionary with has_pending_analysis boolean
@@ -49,7 +89,7 @@ async def check_pending_analysis(
         GET /api/v1/diagnostics/patient/PAT-001/pending
         Response: {"has_pending_analysis": true}
     """
-    logger.info(f"Checking pending analysis for patient: {patient_id}")
+    logger.info("Checking pending analysis for patient: %s", patient_id)
 
     has_pending = patient_id in PENDING_ANALYSIS_REQUESTS
 
@@ -59,7 +99,10 @@ async def check_pending_analysis(
     }
 
 
-@router.get("/patient/{patient_id}/latest", response_model=DiagnosticResponse)
+@router.get(
+    "/patient/{patient_id}/latest",
+    responses={status.HTTP_200_OK: {"model": DiagnosticResponse}}
+)
 async def get_latest_patient_diagnostic(
     patient_id: str = Path(...,
                            description="Patient ID to retrieve latest diagnostic for"),
@@ -78,7 +121,8 @@ async def get_latest_patient_diagnostic(
         repo_factory (RepositoryFactory): Database repository factory
 
     Returns:
-        DiagnosticResponse: Latest diagnostic result for the patient
+        ORJSONResponse: Latest diagnostic result for the patient
+            (DiagnosticResponse)
 
     Raises:
         HTTPException: 
@@ -88,47 +132,32 @@ async def get_latest_patient_diagnostic(
     Example:
         GET /api/v1/diagnostics/patient/PAT-001/latest
     """
-    logger.info(f"Retrieving latest diagnostic for patient: {patient_id}")
+    logger.info("Retrieving latest diagnostic for patient: %s", patient_id)
 
     try:
-        # Verify patient exists
-        patient_repo = repo_factory.patient_repository
-        patient = await patient_repo.get_by_id(patient_id)
-
-        if not patient:
-            logger.warning(f"Patient not found: {patient_id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Patient not found: {patient_id}"
-            )
-
         # Get the latest diagnostic for the patient
         ai_diagnostic_repo = repo_factory.ai_diagnostic_repository
         diagnostic = await ai_diagnostic_repo.get_latest_patient_diagnostic(patient_id)
 
         if not diagnostic:
-            logger.warning(f"No diagnostics found for patient: {patient_id}")
+            # Diagnostics are only created for existing patients, so the
+            # patient lookup is needed only to tell the two 404s apart
+            await _ensure_patient_exists(repo_factory, patient_id)
+            logger.warning("No diagnostics found for patient: %s", patient_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"No diagnostics found for patient: {patient_id}"
             )
 
         logger.info(
-            f"Retrieved latest diagnostic: {diagnostic.diagnostic_id} for patient: {patient_id}")
-
-        # Convert to response model
-        return DiagnosticResponse(
-            diagnostic_id=diagnostic.diagnostic_id,
-            patient_id=diagnostic.patient_id,
-            sequence_number=diagnostic.sequence_number,
-            test_date=diagnostic.test_date,
-            diagnostic_summary=diagnostic.diagnostic_summary,
-            ai_diagnostic=diagnostic.ai_diagnostic,
-            pdf_metadata=diagnostic.pdf_metadata,
-            processing_info=diagnostic.processing_info,
-            veterinarian_review=diagnostic.veterinarian_review,
-            created_by=diagnostic.created_by,
-            created_at=diagnostic.created_at
+            "Retrieved latest diagnostic: %s for patient: %s",
+            diagnostic.diagnostic_id, patient_id)
+
+        # Polling clients may reuse the answer briefly (matches the
+        # repository's latest-diagnostic cache TTL)
+        return ORJSONResponse(
+            content=_to_diagnostic_response(diagnostic).model_dump(mode="json"),
+            headers={"Cache-Control": "private, max-age=10"}
         )
 
     except HTTPException:
@@ -136,14 +165,17 @@ async def get_latest_patient_diagnostic(
         raise
     except Exception as e:
         logger.exception(
-            f"Error retrieving latest diagnostic for patient {patient_id}: {e}")
+            "Error retrieving latest diagnostic for patient %s: %s", patient_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error while retrieving diagnostic"
         )
 
 
-@router.get("/patient/{patient_id}", response_model=DiagnosticListResponse)
+@router.get(
+    "/patient/{patient_id}",
+    responses={status.HTTP_200_OK: {"model": DiagnosticListResponse}}
+)
 async def get_patient_diagnostics(
     patient_id: str = Path(...,
                            description="Patient ID to retrieve diagnostics for"),
@@ -166,7 +198,8 @@ async def get_patient_diagnostics(
         repo_factory (RepositoryFactory): Database repository factory
 
     Returns:
-        DiagnosticListResponse: List of diagnostic results with pagination metadata
+        ORJSONResponse: List of diagnostic results with pagination metadata
+            (DiagnosticListResponse)
 
     Raises:
         HTTPException: 
@@ -177,20 +210,10 @@ async def get_patient_diagnostics(
         GET /api/v1/diagnostics/patient/PAT-001?page=1&limit=10
     """
     logger.info(
-        f"Retrieving diagnostics for patient: {patient_id} (page {page}, limit {limit})")
+        "Retrieving diagnostics for patient: %s (page %d, limit %d)",
+        patient_id, page, limit)
 
     try:
-        # Verify patient exists
-        patient_repo = repo_factory.patient_repository
-        patient = await patient_repo.get_by_id(patient_id)
-
-        if not patient:
-            logger.warning(f"Patient not found: {patient_id}")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Patient not found: {patient_id}"
-            )
-
         # Calculate skip value for pagination
         skip = (page - 1) * limit
 
@@ -200,53 +223,44 @@ async def get_patient_diagnostics(
             patient_id, skip, limit
         )
 
+        if total == 0:
+            # Only an empty result can mean the patient does not exist
+            await _ensure_patient_exists(repo_factory, patient_id)
+
         if not diagnostics and total > 0:
             # If we got no results but there are diagnostics, the page is out of range
             logger.warning(
-                f"Page {page} is out of range for patient: {patient_id}")
+                "Page %d is out of range for patient: %s", page, patient_id)
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Page {page} is out of range"
             )
 
         logger.info(
-            f"Retrieved {len(diagnostics)} diagnostics for patient: {patient_id}")
+            "Retrieved %d diagnostics for patient: %s", len(diagnostics), patient_id)
 
         # Convert to response models
         diagnostic_responses = [
-            DiagnosticResponse(
-                diagnostic_id=diagnostic.diagnostic_id,
-                patient_id=diagnostic.patient_id,
-                sequence_number=diagnostic.sequence_number,
-                test_date=diagnostic.test_date,
-                diagnostic_summary=diagnostic.diagnostic_summary,
-                ai_diagnostic=diagnostic.ai_diagnostic,
-                pdf_metadata=diagnostic.pdf_metadata,
-                processing_info=diagnostic.processing_info,
-                veterinarian_review=diagnostic.veterinarian_review,
-                created_by=diagnostic.created_by,
-                created_at=diagnostic.created_at
-            )
-            for diagnostic in diagnostics
+            _to_diagnostic_response(diagnostic) for diagnostic in diagnostics
         ]
 
         # Calculate if there are more results
         has_more = (skip + limit) < total
 
-        return DiagnosticListResponse(
+        return ORJSONResponse(content=DiagnosticListResponse.model_construct(
             diagnostics=diagnostic_responses,
             total=total,
             limit=limit,
             skip=skip,
             has_more=has_more
-        )
+        ).model_dump(mode="json"))
 
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
         logger.exception(
-            f"Error retrieving diagnostics for patient {patient_id}: {e}")
+            "Error retrieving diagnostics for patient %s: %s", patient_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error while retrieving diagnostics"
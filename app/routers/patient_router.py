@@ -16,29 +16,84 @@ Last updated: 2025-06-20
 Author: Bedirhan Gilgiler
 """
 
-from datetime import datetime, timezone
-from typing import Union
+from typing import AsyncIterator, Union
 
+import orjson
 from app.dependencies.auth_dependencies import (
     get_repository_factory,
     require_authenticated,
     require_vet_or_admin,
 )
 from app.models.database_models import Admin, Patient, User
-from app.repositories import RepositoryFactory
+from app.repositories import PatientRepository, RepositoryFactory
 from app.schemas.patient_schemas import (
     PatientCreate,
     PatientListResponse,
+    PatientPageResponse,
     PatientResponse,
+    PatientSummaryResponse,
     PatientUpdate,
 )
 from app.utils.logger_utils import ApplicationLogger
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
 # Initialize router and logger
-router = APIRouter(prefix="/api/v1/patients", tags=["Patient Management"])
+router = APIRouter(
+    prefix="/api/v1/patients",
+    tags=["Patient Management"],
+    default_response_class=ORJSONResponse
+)
 logger = ApplicationLogger.get_logger("patient_router")
 
+# Media type clients send in Accept to receive list pages as a stream
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _wants_ndjson(request: Request) -> bool:
+    """Whether the client asked for a streamed NDJSON page"""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def _stream_patients(cursor) -> AsyncIterator[bytes]:
+    """Encode patient documents one JSON line at a time as they arrive"""
+    try:
+        async for doc in cursor:
+            doc["patient_id"] = doc.pop("_id")
+            yield orjson.dumps(
+                PatientResponse.model_validate(doc).model_dump()) + b"\n"
+    except Exception as e:
+        # Headers are already sent, so the stream can only be cut short
+        logger.error("Error streaming patients: %s", e)
+    finally:
+        await cursor.close()
+
+
+async def _stream_patient_page(
+    patient_repo: PatientRepository,
+    page: int,
+    limit: int,
+    name: str | None = None
+) -> StreamingResponse:
+    """
+    Stream one page of patients as NDJSON.
+
+    Pagination metadata travels in headers so nothing has to be buffered
+    before the first row is written.
+    """
+    total = await patient_repo.count_active(name)
+    cursor = patient_repo.get_page_cursor(
+        skip=(page - 1) * limit, limit=limit, name=name)
+    return StreamingResponse(
+        _stream_patients(cursor),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={
+            "X-Total-Count": str(total),
+            "X-Page": str(page),
+            "X-Limit": str(limit),
+        }
+    )
+
 
 @router.post("/", response_model=PatientResponse, status_code=status.HTTP_201_CREATED)
 async def create_patient(
@@ -81,10 +136,8 @@ async def create_patient(
     logger.info(f"Patient creation request by user: {current_user.username}")
 
     # Determine creator ID based on user type
-    if isinstance(current_user, Admin):
-        creator_id = current_user.admin_id
-    else:
-        creator_id = current_user.user_id
+    creator_id = current_user.admin_id if isinstance(
+        current_user, Admin) else current_user.user_id
 
     if not creator_id:
         logger.error("Patient creation failed: missing user ID")
@@ -122,26 +175,12 @@ async def create_patient(
     logger.info(f"Patient created successfully: {created_patient.patient_id}")
 
     # Convert to response format
-    return PatientResponse(
-        patient_id=created_patient.patient_id,
-        name=created_patient.name,
-        species=created_patient.species,
-        breed=created_patient.breed,
-        birthdate=created_patient.birthdate,
-        sex=created_patient.sex,
-        weight=created_patient.weight,
-        owner_info=created_patient.owner_info,
-        medical_history=created_patient.medical_history,
-        created_by=created_patient.created_by,
-        assigned_to=created_patient.assigned_to,
-        created_at=created_patient.created_at,
-        updated_at=created_patient.updated_at,
-        is_active=created_patient.is_active
-    )
+    return PatientResponse.model_validate(created_patient)
 
 
-@router.get("/", response_model=PatientListResponse)
+@router.get("/", response_model=PatientListResponse, deprecated=True)
 async def get_all_patients(
+    request: Request,
     page: int = 1,
     limit: int = 10,
     current_user: Union[Admin, User] = Depends(require_authenticated),
@@ -151,9 +190,15 @@ async def get_all_patients(
     Retrieve all patients from the system with pagination.
 
     This endpoint returns a paginated list of patients in the database,
-    accessible to all authenticated users.
+    accessible to all authenticated users. Clients sending
+    ``Accept: application/x-ndjson`` receive the page as a stream of JSON
+    lines, with the total in the ``X-Total-Count`` header.
+
+    Deprecated: counting and skipping get slower with every page; use
+    GET /api/v1/patients/page instead.
 
     Args:
+        request (Request): Incoming request, used for content negotiation
         page (int): Page number (1-indexed)
         limit (int): Number of items per page
         current_user (Union[Admin, User]): Authenticated user
@@ -192,6 +237,9 @@ async def get_all_patients(
     skip = (page - 1) * limit
 
     patient_repo = repo_factory.patient_repository
+    if _wants_ndjson(request):
+        return await _stream_patient_page(patient_repo, page, limit)
+
     patients, total = await patient_repo.get_all(skip=skip, limit=limit)
 
     logger.info(
@@ -199,24 +247,7 @@ async def get_all_patients(
 
     # Convert to response format
     patient_responses = [
-        PatientResponse(
-            patient_id=patient.patient_id,
-            name=patient.name,
-            species=patient.species,
-            breed=patient.breed,
-            birthdate=patient.birthdate,
-            sex=patient.sex,
-            weight=patient.weight,
-            owner_info=patient.owner_info,
-            medical_history=patient.medical_history,
-            created_by=patient.created_by,
-            assigned_to=patient.assigned_to,
-            created_at=patient.created_at,
-            updated_at=patient.updated_at,
-            is_active=patient.is_active
-        )
-        for patient in patients
-    ]
+        PatientResponse.model_validate(patient) for patient in patients]
 
     return PatientListResponse(
         patients=patient_responses,
@@ -226,6 +257,67 @@ async def get_all_patients(
     )
 
 
+@router.get("/page", response_model=PatientPageResponse)
+async def get_patient_page(
+    after: str | None = None,
+    limit: int = 10,
+    current_user: Union[Admin, User] = Depends(require_authenticated),
+    repo_factory: RepositoryFactory = Depends(get_repository_factory)
+):
+    """
+    Retrieve active patients, newest first, with keyset pagination.
+
+    Each page carries an opaque ``next_cursor``; pass it back as ``after``
+    to fetch the following page. No total is computed, so every page costs
+    the same regardless of how deep the client has scrolled. Patients are
+    summarized without owner information and medical history; fetch
+    GET /api/v1/patients/{patient_id} for the full record.
+
+    Args:
+        after (str | None): next_cursor of the previous page
+        limit (int): Number of items per page
+        current_user (Union[Admin, User]): Authenticated user
+        repo_factory (RepositoryFactory): Database repository factory
+
+    Returns:
+        PatientPageResponse: Patients and the cursor of the next page
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+
+    Example:
+        GET /api/v1/patients/page?limit=10
+        Response: {
+            "patients": [...],
+            "next_cursor": "1750550400000.PAT-042",
+            "limit": 10
+        }
+    """
+    logger.info(f"Retrieving patient page (after {after}, limit {limit})")
+
+    # Validate pagination parameters
+    if limit < 1:
+        limit = 10
+    elif limit > 100:
+        limit = 100
+
+    patient_repo = repo_factory.patient_repository
+    try:
+        patients, next_cursor = await patient_repo.get_page_after(after, limit)
+    except ValueError:
+        logger.warning(f"Invalid page cursor: {after}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid page cursor"
+        )
+
+    return PatientPageResponse(
+        patients=[PatientSummaryResponse.model_validate(p) for p in patients],
+        next_cursor=next_cursor,
+        limit=limit
+    )
+
+
 @router.get("/{patient_id}", response_model=PatientResponse)
 async def get_patient(
     patient_id: str,
@@ -271,22 +363,7 @@ async def get_patient(
 
     logger.info(f"Patient retrieved: {patient_id}")
 
-    return PatientResponse(
-        patient_id=patient.patient_id,
-        name=patient.name,
-        species=patient.species,
-        breed=patient.breed,
-        birthdate=patient.birthdate,
-        sex=patient.sex,
-        weight=patient.weight,
-        owner_info=patient.owner_info,
-        medical_history=patient.medical_history,
-        created_by=patient.created_by,
-        assigned_to=patient.assigned_to,
-        created_at=patient.created_at,
-        updated_at=patient.updated_at,
-        is_active=patient.is_active
-    )
+    return PatientResponse.model_validate(patient)
 
 
 @router.put("/{patient_id}", response_model=PatientResponse)
@@ -314,7 +391,7 @@ async def update_patient(
     Raises:
         HTTPException:
             - 404: If patient not found
-            - 400: If update fails
+            - 400: If no fields are provided
 
     Example:
         PUT /api/v1/patients/PAT-001
@@ -327,21 +404,8 @@ async def update_patient(
     """
     logger.info(f"Updating patient: {patient_id}")
 
-    patient_repo = repo_factory.patient_repository
-    patient = await patient_repo.get_by_id(patient_id)
-
-    if not patient:
-        logger.warning(f"Patient not found: {patient_id}")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Patient not found"
-        )
-
-    # Build update data from request
-    update_data = {}
-    for field, value in patient_data.dict(exclude_unset=True).items():
-        if value is not None:
-            update_data[field] = value
+    # Build update data from request, excluding unset and None values
+    update_data = patient_data.model_dump(exclude_unset=True, exclude_none=True)
 
     if not update_data:
         logger.warning("No valid fields to update")
@@ -350,46 +414,21 @@ async def update_patient(
             detail="No valid fields to update"
         )
 
-    # Add updated timestamp
-    update_data["updated_at"] = datetime.now(timezone.utc)
-
-    # Update patient
-    success = await patient_repo.update(patient_id, update_data)
-
-    if not success:
-        logger.error(f"Failed to update patient: {patient_id}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to update patient"
-        )
+    # Apply the update and read the result back atomically; the repository
+    # stamps updated_at
+    patient_repo = repo_factory.patient_repository
+    updated_patient = await patient_repo.update_and_get(patient_id, update_data)
 
-    # Get updated patient
-    updated_patient = await patient_repo.get_by_id(patient_id)
     if not updated_patient:
-        logger.error(f"Failed to retrieve updated patient: {patient_id}")
+        logger.warning(f"Patient not found: {patient_id}")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Failed to retrieve updated patient"
+            detail="Patient not found"
         )
 
     logger.info(f"Patient updated successfully: {patient_id}")
 
-    return PatientResponse(
-        patient_id=updated_patient.patient_id,
-        name=updated_patient.name,
-        species=updated_patient.species,
-        breed=updated_patient.breed,
-        birthdate=updated_patient.birthdate,
-        sex=updated_patient.sex,
-        weight=updated_patient.weight,
-        owner_info=updated_patient.owner_info,
-        medical_history=updated_patient.medical_history,
-        created_by=updated_patient.created_by,
-        assigned_to=updated_patient.assigned_to,
-        created_at=updated_patient.created_at,
-        updated_at=updated_patient.updated_at,
-        is_active=updated_patient.is_active
-    )
+    return PatientResponse.model_validate(updated_patient)
 
 
 @router.delete("/{patient_id}")
@@ -413,9 +452,7 @@ async def delete_patient(
         dict: Deletion success message
 
     Raises:
-        HTTPException:
-            - 404: If patient not found
-            - 400: If deletion fails
+        HTTPException: 404 if no active patient has this ID
 
     Example:
         DELETE /api/v1/patients/PAT-001
@@ -423,35 +460,24 @@ async def delete_patient(
     """
     logger.info(f"Deleting patient: {patient_id}")
 
-    patient_repo = repo_factory.patient_repository
-    patient = await patient_repo.get_by_id(patient_id)
-
-    if not patient:
-        logger.warning(f"Patient not found: {patient_id}")
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Patient not found"
-        )
-
     # Get user ID based on user type
-    from app.models.database_models import Admin
-    if isinstance(current_user, Admin):
-        user_id = current_user.admin_id
-    else:
-        user_id = current_user.user_id
+    user_id = current_user.admin_id if isinstance(
+        current_user, Admin) else current_user.user_id
 
     # Log deletion attempt with user info
     logger.info(
         f"Deletion of patient {patient_id} requested by: {current_user.username} ({user_id})")
 
-    # Soft delete the patient
+    # Soft delete the patient; no match means there is no active patient
+    # with this ID, so the write doubles as the existence check
+    patient_repo = repo_factory.patient_repository
     success = await patient_repo.soft_delete(patient_id)
 
     if not success:
-        logger.error(f"Failed to delete patient: {patient_id}")
+        logger.warning(f"Patient not found: {patient_id}")
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to delete patient"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Patient not found"
         )
 
     logger.info(f"Patient deleted successfully: {patient_id}")
@@ -461,6 +487,7 @@ async def delete_patient(
 
 @router.get("/search/{name}", response_model=PatientListResponse)
 async def search_patients(
+    request: Request,
     name: str,
     page: int = 1,
     limit: int = 10,
@@ -472,8 +499,10 @@ async def search_patients(
 
     This endpoint performs a text search on patient names and returns
     matching patients with pagination, accessible to all authenticated users.
+    Supports the same NDJSON streaming as the patient list.
 
     Args:
+        request (Request): Incoming request, used for content negotiation
         name (str): Name to search for
         page (int): Page number (1-indexed)
         limit (int): Number of items per page
@@ -513,6 +542,9 @@ async def search_patients(
     skip = (page - 1) * limit
 
     patient_repo = repo_factory.patient_repository
+    if _wants_ndjson(request):
+        return await _stream_patient_page(patient_repo, page, limit, name)
+
     patients, total = await patient_repo.search_by_name(name, skip=skip, limit=limit)
 
     logger.info(
@@ -520,24 +552,7 @@ async def search_patients(
 
     # Convert to response format
     patient_responses = [
-        PatientResponse(
-            patient_id=patient.patient_id,
-            name=patient.name,
-            species=patient.species,
-            breed=patient.breed,
-            birthdate=patient.birthdate,
-            sex=patient.sex,
-            weight=patient.weight,
-            owner_info=patient.owner_info,
-            medical_history=patient.medical_history,
-            created_by=patient.created_by,
-            assigned_to=patient.assigned_to,
-            created_at=patient.created_at,
-            updated_at=patient.updated_at,
-            is_active=patient.is_active
-        )
-        for patient in patients
-    ]
+        PatientResponse.model_validate(patient) for patient in patients]
 
     return PatientListResponse(
         patients=patient_responses,
@@ -578,25 +593,7 @@ async def search_patients(
 
     logger.info(f"Retrieved {len(patients)} recent patients")
 
-    return [
-        PatientResponse(
-            patient_id=patient.patient_id,
-            name=patient.name,
-            species=patient.species,
-            breed=patient.breed,
-            birthdate=patient.birthdate,
-            sex=patient.sex,
-            weight=patient.weight,
-            owner_info=patient.owner_info,
-            medical_history=patient.medical_history,
-            created_by=patient.created_by,
-            assigned_to=patient.assigned_to,
-            created_at=patient.created_at,
-            updated_at=patient.updated_at,
-            is_active=patient.is_active
-        )
-        for patient in patients
-    ]
+    return [PatientResponse.model_validate(patient) for patient in patients]
 
 
 @router.get("/health")
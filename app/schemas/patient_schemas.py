@@ -46,7 +46,7 @@ class PatientResponse(BaseModel):
     is_active: bool
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 
 class PatientListResponse(BaseModel):
@@ -55,3 +55,27 @@ class PatientListResponse(BaseModel):
     total: int
     page: int
     limit: int
+
+
+class PatientSummaryResponse(BaseModel):
+    """Patient response for list views (no owner or medical history)"""
+    patient_id: str
+    name: str
+    species: str
+    breed: str
+    birthdate: datetime
+    sex: str
+    assigned_to: str
+    created_at: datetime
+    updated_at: datetime
+    is_active: bool
+
+    class Config:
+        from_attributes = True
+
+
+class PatientPageResponse(BaseModel):
+    """Keyset-paginated patient list response"""
+    patients: list[PatientSummaryResponse]
+    next_cursor: str | None
+    limit: int
@@ -23,7 +23,37 @@ from motor.motor_asyncio import (
     AsyncIOMotorDatabase,
     AsyncIOMotorGridFSBucket,
 )
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import IndexModel
+from pymongo.errors import (
+    ConnectionFailure,
+    OperationFailure,
+    ServerSelectionTimeoutError,
+)
+
+# MongoDB error code raised when an index with the same key pattern
+# already exists with different options (e.g. a plain index vs a TTL index)
+INDEX_OPTIONS_CONFLICT_CODE = 85
+# MongoDB error code for dropping an index that does not exist
+INDEX_NOT_FOUND_CODE = 27
+
+# GridFS default chunk size; reading uploads in the same size means every
+# read maps onto exactly one stored chunk
+GRIDFS_CHUNK_SIZE = 255 * 1024
+
+# Mapping of entity types to human-readable ID prefixes
+ID_PREFIX_MAP = {
+    "patient": "PAT",
+    "veterinarian": "VET",
+    "technician": "TEC",
+    "admin": "ADM",
+    "diagnostic": "DGN",
+    "token": "TKN"
+}
+DEFAULT_ID_PREFIX = "UNK"
+
+# Precomputed ID templates (e.g. "PAT-%03d") so generation is a single % format
+ID_FORMATS = {entity: f"{prefix}-%03d" for entity, prefix in ID_PREFIX_MAP.items()}
+DEFAULT_ID_FORMAT = f"{DEFAULT_ID_PREFIX}-%03d"
 
 
 class DatabaseService:
@@ -60,8 +90,13 @@ class DatabaseService:
 
             # Patient collection indexes
             # No need for patient_id index since it's stored as _id which is already indexed
-            await self.patients.create_index("assigned_to")
+            await self.patients.create_index([("assigned_to", 1), ("is_active", 1)])
+            # Superseded by the compound index above
+            await self._drop_index_if_exists(self.patients, "assigned_to_1")
             await self.patients.create_index([("name", "text"), ("owner_info.name", "text")])
+            # Backs keyset pagination (newest first, _id breaks ties)
+            await self.patients.create_index(
+                [("is_active", 1), ("created_at", -1), ("_id", -1)])
 
             # AI Diagnostics collection indexes
             # No need for diagnostic_id index since it's stored as _id which is already indexed
@@ -71,9 +106,23 @@ class DatabaseService:
 
             # Users collection indexes
             # No need for user_id index since it's stored as _id which is already indexed
-            await self.users.create_index("username", unique=True)
-            await self.users.create_index("email", unique=True)
-            await self.users.create_index("approval_status")
+            # Role / approval listings sort by (created_at, _id), so the sort
+            # keys are part of each compound index to avoid an in-memory SORT
+            # stage
+            await self.users.create_indexes([
+                IndexModel([("username", 1)], unique=True),
+                IndexModel([("email", 1)], unique=True),
+                IndexModel([("role", 1), ("created_at", -1), ("_id", -1)]),
+                IndexModel([("approval_status", 1),
+                            ("created_at", -1), ("_id", -1)]),
+                IndexModel([("role", 1), ("is_active", 1), ("approval_status", 1),
+                            ("created_at", -1), ("_id", -1)]),
+            ])
+            # Superseded by the indexes above, which add the _id tiebreaker
+            for name in ("role_1_created_at_-1",
+                         "approval_status_1_created_at_-1",
+                         "role_1_is_active_1_approval_status_1_created_at_-1"):
+                await self._drop_index_if_exists(self.users, name)
 
             # Admins collection indexes
             # No need for admin_id index since it's stored as _id which is already indexed
@@ -82,16 +131,80 @@ class DatabaseService:
 
             # Refresh tokens collection indexes
             await self.refresh_tokens.create_index("token_hash", unique=True)
-            await self.refresh_tokens.create_index("user_id")
-            await self.refresh_tokens.create_index("expires_at")
+            await self.refresh_tokens.create_index([("user_id", 1), ("is_active", 1)])
+            # Superseded by the compound index above
+            await self._drop_index_if_exists(self.refresh_tokens, "user_id_1")
+            # TTL index: MongoDB's background monitor removes expired tokens,
+            # so no application-driven cleanup job is needed
+            await self._ensure_ttl_index(self.refresh_tokens, "expires_at")
 
             self.logger.info("Database indexes created successfully")
             return True
 
         except Exception as e:
-            self.logger.error(f"Failed to initialize database indexes: {e}")
+            self.logger.error("Failed to initialize database indexes: %s", e)
             return False
 
+    async def missing_indexes(self, collection, key_patterns: list) -> list:
+        """
+        Find which of the given index key patterns a collection lacks.
+
+        Queries that pass hint= fail outright when the hinted index does not
+        exist, so callers check them once at startup.
+
+        Args:
+            collection: Collection to inspect
+            key_patterns: Key patterns, e.g. [[("patient_id", 1), ("test_date", -1)]]
+
+        Returns:
+            list: The key patterns with no matching index
+        """
+        info = await collection.index_information()
+        existing = [list(index["key"]) for index in info.values()]
+        return [pattern for pattern in key_patterns
+                if list(pattern) not in existing]
+
+    async def _drop_index_if_exists(self, collection, name: str) -> None:
+        """
+        Drop an index left behind by older deployments, if it is still there.
+
+        Args:
+            collection: Collection holding the index
+            name: Index name, e.g. "assigned_to_1"
+        """
+        try:
+            await collection.drop_index(name)
+            self.logger.info("Dropped superseded index %s.%s",
+                             collection.name, name)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND_CODE:
+                raise
+
+    async def _ensure_ttl_index(self, collection, field: str) -> None:
+        """
+        Create a TTL index that expires documents at the date stored in field.
+
+        Older deployments created a plain index on the same field; MongoDB
+        refuses to create a second index with the same key pattern, so the
+        existing index is converted in place with collMod instead.
+
+        Args:
+            collection: Collection to index
+            field: Date field holding the expiration timestamp
+        """
+        try:
+            await collection.create_index(field, expireAfterSeconds=0)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT_CODE:
+                raise
+            self.logger.info(
+                "Converting existing index on %s.%s to TTL", collection.name, field)
+            await self.database.command(
+                "collMod",
+                collection.name,
+                index={"keyPattern": {field: 1}, "expireAfterSeconds": 0}
+            )
+
     async def connect(self) -> bool:
         """
         Connect to MongoDB database
@@ -106,6 +219,8 @@ class DatabaseService:
                 self.config.connection_string,
                 maxPoolSize=self.config.max_pool_size,
                 minPoolSize=self.config.min_pool_size,
+                maxIdleTimeMS=self.config.max_idle_time_ms,
+                waitQueueTimeoutMS=self.config.wait_queue_timeout_ms,
                 serverSelectionTimeoutMS=self.config.timeout_ms
             )
 
@@ -119,15 +234,15 @@ class DatabaseService:
             self.gridfs = AsyncIOMotorGridFSBucket(self.database)
 
             self.logger.info(
-                f"Successfully connected to MongoDB database: {self.config.database_name}")
+                "Successfully connected to MongoDB database: %s", self.config.database_name)
             return True
 
         except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-            self.logger.error(f"Failed to connect to MongoDB: {e}")
+            self.logger.error("Failed to connect to MongoDB: %s", e)
             return False
         except Exception as e:
             self.logger.error(
-                f"Unexpected error during MongoDB connection: {e}")
+                "Unexpected error during MongoDB connection: %s", e)
             return False
 
     async def disconnect(self) -> None:
@@ -201,19 +316,6 @@ class DatabaseService:
         Returns:
             str: Next ID in format PREFIX-XXX (e.g., PAT-001, VET-001)
         """
-        # Define mapping of entity types to prefixes
-        prefix_map = {
-            "patient": "PAT",
-            "veterinarian": "VET",
-            "technician": "TEC",
-            "admin": "ADM",
-            "diagnostic": "DGN",
-            "token": "TKN"
-        }
-
-        # Get the prefix for this entity type
-        prefix = prefix_map.get(entity_type, "UNK")
-
         try:
             # Use MongoDB's findAndModify (find_one_and_update in PyMongo) for atomic operations
             # This atomically increments and returns the updated counter
@@ -225,15 +327,17 @@ class DatabaseService:
             )
 
             # Format the ID with leading zeros (e.g., PAT-001)
-            next_id = f"{prefix}-{result['seq']:03d}"
-            self.logger.info(f"Generated next ID for {entity_type}: {next_id}")
+            next_id = ID_FORMATS.get(
+                entity_type, DEFAULT_ID_FORMAT) % result['seq']
+            self.logger.info("Generated next ID for %s: %s", entity_type, next_id)
             return next_id
 
         except Exception as e:
-            self.logger.error(f"Error generating sequential ID: {e}")
+            self.logger.error("Error generating sequential ID: %s", e)
             # Fallback to a timestamp-based ID in case of error
             import time
             timestamp = int(time.time())
+            prefix = ID_PREFIX_MAP.get(entity_type, DEFAULT_ID_PREFIX)
             return f"{prefix}-{timestamp}"
 
     async def store_pdf_file(self, file_data: bytes, filename: str) -> str:
@@ -257,9 +361,48 @@ class DatabaseService:
         )
 
         self.logger.info(
-            f"Stored PDF file {filename} with GridFS ID: {file_id}")
+            "Stored PDF file %s with GridFS ID: %s", filename, file_id)
         return str(file_id)
 
+    async def store_pdf_stream(
+        self,
+        source,
+        filename: str,
+        chunk_size: int = GRIDFS_CHUNK_SIZE
+    ) -> tuple[str, int]:
+        """
+        Stream a PDF into GridFS chunk by chunk without buffering it in memory
+
+        Args:
+            source: Object with an async read(size) method (e.g. UploadFile)
+            filename: Original filename
+            chunk_size: Number of bytes read and written per iteration
+
+        Returns:
+            tuple[str, int]: GridFS file ID and total number of bytes stored
+        """
+        if self.gridfs is None:
+            raise RuntimeError("Database not connected. Call connect() first.")
+
+        grid_in = self.gridfs.open_upload_stream(
+            filename,
+            metadata={"content_type": "application/pdf"}
+        )
+        file_size = 0
+        try:
+            while chunk := await source.read(chunk_size):
+                await grid_in.write(chunk)
+                file_size += len(chunk)
+            await grid_in.close()
+        except Exception:
+            await grid_in.abort()
+            raise
+
+        self.logger.info(
+            "Stored PDF file %s (%d bytes) with GridFS ID: %s",
+            filename, file_size, grid_in._id)
+        return str(grid_in._id), file_size
+
     async def get_pdf_file(self, file_id: str) -> bytes:
         """
         Retrieve PDF file from GridFS
@@ -276,3 +419,31 @@ class DatabaseService:
         from bson import ObjectId
         grid_out = await self.gridfs.open_download_stream(ObjectId(file_id))
         return await grid_out.read()
+
+    async def delete_pdf_file(self, file_id: str) -> None:
+        """
+        Delete a PDF file and its chunks from GridFS
+
+        Args:
+            file_id: GridFS file ID
+        """
+        if self.gridfs is None:
+            raise RuntimeError("Database not connected. Call connect() first.")
+
+        from bson import ObjectId
+        await self.gridfs.delete(ObjectId(file_id))
+        self.logger.info("Deleted PDF file with GridFS ID: %s", file_id)
+
+    async def download_pdf_to_stream(self, file_id: str, destination) -> None:
+        """
+        Write a PDF from GridFS into a writable file object chunk by chunk
+
+        Args:
+            file_id: GridFS file ID
+            destination: Writable binary file object
+        """
+        if self.gridfs is None:
+            raise RuntimeError("Database not connected. Call connect() first.")
+
+        from bson import ObjectId
+        await self.gridfs.download_to_stream(ObjectId(file_id), destination)
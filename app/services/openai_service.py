@@ -182,9 +182,9 @@ class BloodworkAnalysisService:
 
         for image_path in image_paths:
             try:
-                # Encode image to base64
-                base64_image = self._file_processor.encode_image_to_base64(
-                    image_path)
+                # Encode image to base64 (blocking file read) in a worker thread
+                base64_image = await asyncio.to_thread(
+                    self._file_processor.encode_image_to_base64, image_path)
 
                 # Create image message object
                 image_message = {
@@ -9,16 +9,21 @@ Last updated: 2025-06-18
 Author: Bedirhan Gilgiler
 """
 
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
 from datetime import datetime, timezone
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, NamedTuple, Union
 
 from app.dependencies.auth_dependencies import (
     get_database_service,
     get_repository_factory,
 )
 from app.models.database_models import Admin, AiDiagnostic, User
+from app.services.database_service import GRIDFS_CHUNK_SIZE
 from app.services.openai_service import BloodworkAnalysisService
 from app.utils.file_utils import PdfImageConverter
 from app.utils.logger_utils import ApplicationLogger
@@ -28,6 +33,19 @@ from fastapi import BackgroundTasks, HTTPException, UploadFile
 # Key: patient_id, Value: timestamp of request
 PENDING_ANALYSIS_REQUESTS = {}
 
+# Bounded LRU of completed analysis results keyed by diagnostic_id.
+# AI output is write-once, so polling clients can be served from memory
+# once the result exists without another database round trip.
+ANALYSIS_RESULT_CACHE: "OrderedDict[str, CachedAnalysisResult]" = OrderedDict()
+ANALYSIS_RESULT_CACHE_SIZE = 1024
+
+
+class CachedAnalysisResult(NamedTuple):
+    """Completed analysis with its JSON encoding and ETag computed once."""
+    result: dict[str, Any]
+    body: bytes
+    etag: str
+
 
 class PdfAnalysisConfiguration:
     """
@@ -40,6 +58,11 @@ class PdfAnalysisConfiguration:
     def __init__(self):
         """Initialize configuration with default settings."""
         self.supported_content_type = "application/pdf"
+        self.pdf_magic_bytes = b"%PDF"
+        self.upload_chunk_size = GRIDFS_CHUNK_SIZE
+        # Analyses allowed to run at once per worker; the rest wait their
+        # turn instead of all competing for the thread pool and OpenAI
+        self.max_concurrent_analyses = 4
         self.temp_file_suffix = ".pdf"
 
 
@@ -59,6 +82,8 @@ class BloodworkPdfAnalysisService:
         self._ai_service = BloodworkAnalysisService()
         self._db_service = get_database_service()
         self._repo_factory = get_repository_factory(self._db_service)
+        self._analysis_slots = asyncio.Semaphore(
+            self._config.max_concurrent_analyses)
         # Track processing metrics
         self._last_processing_time_ms = 0
         self._model_version = "gpt-4o"
@@ -124,38 +149,40 @@ class BloodworkPdfAnalysisService:
             HTTPException: If file validation or processing fails
         """
         # Validate file type
-        self._validate_uploaded_file(uploaded_file)
+        await self._validate_uploaded_file(uploaded_file)
 
         self._logger.info(
-            f"Processing PDF: {uploaded_file.filename} (user: {current_user.username}, patient: {patient_id})")
+            "Processing PDF: %s (user: %s, patient: %s)",
+            uploaded_file.filename, current_user.username, patient_id)
 
+        gridfs_id = None
         try:
-            # Verify patient exists
             patient_repo = self._repo_factory.patient_repository
-            patient = await patient_repo.get_by_id(patient_id)
+            ai_repo = self._repo_factory.ai_diagnostic_repository
+
+            # The patient check, the diagnostic ID allocation and the
+            # patient's next sequence number are independent round trips, so
+            # run them together. The PDF is only stored once the patient is
+            # known to exist.
+            patient_exists, diagnostic_id, sequence_number = await asyncio.gather(
+                patient_repo.exists(patient_id),
+                self._db_service.get_next_sequential_id("diagnostic"),
+                ai_repo.get_next_sequence_number(patient_id)
+            )
 
-            if not patient:
-                self._logger.error(f"Patient not found: {patient_id}")
+            if not patient_exists:
+                self._logger.error("Patient not found: %s", patient_id)
                 raise HTTPException(
                     status_code=404,
                     detail=f"Patient not found: {patient_id}"
                 )
 
-            # Read PDF file data
-            pdf_data = await uploaded_file.read()
-
-            # Store PDF in GridFS
+            # Streamed so only one chunk is held in memory
             filename = uploaded_file.filename or "unknown.pdf"
-            gridfs_id = await self._db_service.store_pdf_file(pdf_data, filename)
-
-            # Get AI diagnostic repository
-            ai_repo = self._repo_factory.ai_diagnostic_repository
-
-            # Get next sequence number for this patient
-            sequence_number = await ai_repo.get_next_sequence_number(patient_id)
+            gridfs_id, file_size = await self._db_service.store_pdf_stream(
+                uploaded_file, filename, self._config.upload_chunk_size)
 
             # Get user ID based on user type
-            from app.models.database_models import Admin
             if isinstance(current_user, Admin):
                 creator_id = current_user.admin_id
             else:
@@ -163,14 +190,14 @@ class BloodworkPdfAnalysisService:
 
             # Create diagnostic record linked to the patient
             diagnostic = AiDiagnostic(
-                _id="placeholder",  # Will be replaced by repository
+                _id=diagnostic_id,
                 patient_id=patient_id,
                 sequence_number=sequence_number,
                 test_date=datetime.now(timezone.utc),
                 ai_diagnostic={},  # Will be filled by AI analysis
                 pdf_metadata={
                     "original_filename": filename,
-                    "file_size": len(pdf_data),
+                    "file_size": file_size,
                     "gridfs_id": gridfs_id,
                     "upload_date": datetime.now(timezone.utc)
                 },
@@ -191,7 +218,7 @@ class BloodworkPdfAnalysisService:
 
             # Schedule AI analysis in background
             background_tasks.add_task(
-                self._perform_ai_analysis_and_save_results,
+                self._run_analysis_job,
                 created_diagnostic.diagnostic_id,
                 gridfs_id,
                 patient_id  # Pass patient_id to remove from pending when complete
@@ -202,11 +229,18 @@ class BloodworkPdfAnalysisService:
                 "message": "Analisi in corso. Torna più tardi per vedere i risultati."
             }
 
-        except HTTPException:
-            raise
         except Exception as error:
-            error_msg = f"Failed to process PDF: {uploaded_file.filename}"
-            self._logger.exception(f"{error_msg} - Error: {error}")
+            # No diagnostic references the stored PDF; do not leave it behind
+            if gridfs_id is not None:
+                try:
+                    await self._db_service.delete_pdf_file(gridfs_id)
+                except Exception as cleanup_error:
+                    self._logger.error(
+                        "Failed to delete orphaned PDF %s: %s", gridfs_id, cleanup_error)
+            if isinstance(error, HTTPException):
+                raise
+            self._logger.exception(
+                "Failed to process PDF: %s - Error: %s", uploaded_file.filename, error)
             raise HTTPException(
                 status_code=500,
                 detail="Errore durante l'analisi del PDF"
@@ -219,38 +253,120 @@ class BloodworkPdfAnalysisService:
         """
         Get the stored analysis result for a diagnostic.
 
+        Completed results are cached in-process; pending diagnostics are
+        re-checked on every call with a projection of only ai_diagnostic
+        and the stored processing error.
+
         Args:
             diagnostic_id (str): The diagnostic ID
 
         Returns:
-            dict | None: The analysis result as a dict, or None if not found
+            dict | None: The analysis result as a dict, or None while the
+                analysis is still in progress
+
+        Raises:
+            HTTPException: 404 if the diagnostic does not exist, 422 with
+                the stored error if the analysis failed, 500 if the lookup
+                itself failed
         """
+        cached = ANALYSIS_RESULT_CACHE.get(diagnostic_id)
+        if cached is not None:
+            ANALYSIS_RESULT_CACHE.move_to_end(diagnostic_id)
+            return cached.result
+
         try:
             ai_repo = self._repo_factory.ai_diagnostic_repository
-            diagnostic = await ai_repo.get_by_id(diagnostic_id)
+            doc = await ai_repo.collection.find_one(
+                {"_id": diagnostic_id},
+                {"ai_diagnostic": 1, "processing_info.error": 1})
+        except Exception as error:
+            # Not "still processing": a 202 here would keep pollers
+            # retrying against a failing database
+            self._logger.exception(
+                "Error retrieving analysis result: %s", error)
+            raise HTTPException(
+                status_code=500,
+                detail="Errore durante il recupero del risultato"
+            ) from error
 
-            if not diagnostic:
-                self._logger.error(f"Diagnostic not found: {diagnostic_id}")
-                return None
+        if not doc:
+            self._logger.warning("Diagnostic not found: %s", diagnostic_id)
+            raise HTTPException(
+                status_code=404,
+                detail="Diagnostica non trovata"
+            )
 
-            # Check if analysis is complete
-            if not diagnostic.ai_diagnostic:
+        # Check if analysis is complete
+        ai_diagnostic = doc.get("ai_diagnostic")
+        if not ai_diagnostic:
+            # A failed analysis never gets a result; report it as final
+            # instead of leaving pollers waiting
+            error_message = (doc.get("processing_info") or {}).get("error")
+            if error_message:
                 self._logger.info(
-                    f"No analysis found for diagnostic: {diagnostic_id}")
-                return None
+                    "Analysis failed for diagnostic %s: %s", diagnostic_id, error_message)
+                raise HTTPException(status_code=422, detail=error_message)
 
-            # Return the AI diagnostic data
-            return diagnostic.ai_diagnostic
+            self._logger.info(
+                "No analysis found for diagnostic: %s", diagnostic_id)
+            return None
 
-        except Exception as error:
-            self._logger.exception(
-                f"Error retrieving analysis result: {error}")
+        self._cache_analysis_result(diagnostic_id, ai_diagnostic)
+
+        # Return the AI diagnostic data
+        return ai_diagnostic
+
+    async def get_encoded_analysis_result(
+        self,
+        diagnostic_id: str
+    ) -> tuple[bytes, str] | None:
+        """
+        Get the analysis result as ready-to-send JSON bytes plus its ETag.
+
+        The encoding is done once when the result enters the cache, so
+        repeated polls return the same bytes without re-serializing.
+
+        Args:
+            diagnostic_id (str): The diagnostic ID
+
+        Returns:
+            tuple[bytes, str] | None: (JSON body, quoted ETag), or None
+                while the analysis is still in progress
+
+        Raises:
+            HTTPException: 404 if the diagnostic does not exist, 422 if
+                the analysis failed, 500 if the lookup itself failed
+        """
+        if await self.get_analysis_result(diagnostic_id) is None:
             return None
 
-    def _validate_uploaded_file(self, uploaded_file: UploadFile) -> None:
+        cached = ANALYSIS_RESULT_CACHE[diagnostic_id]
+        return cached.body, cached.etag
+
+    @staticmethod
+    def _cache_analysis_result(diagnostic_id: str, result: dict[str, Any]) -> None:
+        """
+        Store a completed analysis result, evicting the least recently used.
+
+        Args:
+            diagnostic_id (str): The diagnostic ID
+            result (dict): The completed AI diagnostic document
+        """
+        body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        ANALYSIS_RESULT_CACHE[diagnostic_id] = CachedAnalysisResult(
+            result, body, etag)
+        ANALYSIS_RESULT_CACHE.move_to_end(diagnostic_id)
+        if len(ANALYSIS_RESULT_CACHE) > ANALYSIS_RESULT_CACHE_SIZE:
+            ANALYSIS_RESULT_CACHE.popitem(last=False)
+
+    async def _validate_uploaded_file(self, uploaded_file: UploadFile) -> None:
         """
         Validate the uploaded file meets requirements.
 
+        Checks the declared content type first, then sniffs the leading
+        bytes for the PDF signature and rewinds the file for the upload.
+
         Args:
             uploaded_file (UploadFile): File to validate
 
@@ -258,14 +374,42 @@ class BloodworkPdfAnalysisService:
             HTTPException: If file validation fails
         """
         if uploaded_file.content_type != self._config.supported_content_type:
-            error_msg = f"Unsupported file type: {uploaded_file.content_type}"
-            self._logger.error(error_msg)
+            self._logger.error(
+                "Unsupported file type: %s", uploaded_file.content_type)
+            raise HTTPException(
+                status_code=400,
+                detail="Solo file PDF sono accettati."
+            )
+
+        header = await uploaded_file.read(len(self._config.pdf_magic_bytes))
+        await uploaded_file.seek(0)
+        if header != self._config.pdf_magic_bytes:
+            self._logger.error(
+                "Rejected upload without PDF signature: %s", uploaded_file.filename)
             raise HTTPException(
                 status_code=400,
                 detail="Solo file PDF sono accettati."
             )
 
-        self._logger.debug(f"Validated PDF: {uploaded_file.filename}")
+        self._logger.debug("Validated PDF: %s", uploaded_file.filename)
+
+    async def _run_analysis_job(
+        self,
+        diagnostic_id: str,
+        gridfs_id: str,
+        patient_id: str
+    ) -> None:
+        """
+        Run one background analysis once a concurrency slot is free.
+
+        Args:
+            diagnostic_id (str): The diagnostic ID
+            gridfs_id (str): The GridFS file ID for the PDF
+            patient_id (str): The patient ID for tracking
+        """
+        async with self._analysis_slots:
+            await self._perform_ai_analysis_and_save_results(
+                diagnostic_id, gridfs_id, patient_id)
 
     async def _perform_ai_analysis_and_save_results(
         self,
@@ -285,28 +429,26 @@ class BloodworkPdfAnalysisService:
             patient_id (str): The patient ID for tracking
         """
         self._logger.info(
-            f"Starting AI analysis for diagnostic: {diagnostic_id}")
+            "Starting AI analysis for diagnostic: %s", diagnostic_id)
 
         try:
-            # Get PDF from GridFS
-            pdf_data = await self._db_service.get_pdf_file(gridfs_id)
-
-            # Save PDF to temporary file
             with TemporaryDirectory() as temp_dir:
                 temp_dir_path = Path(temp_dir)
                 pdf_path = temp_dir_path / \
                     f"bloodwork{self._config.temp_file_suffix}"
 
+                # Stream PDF from GridFS straight into the temporary file
                 with open(pdf_path, "wb") as f:
-                    f.write(pdf_data)
+                    await self._db_service.download_pdf_to_stream(gridfs_id, f)
 
-                # Convert PDF to images
-                image_paths = self._convert_pdf_to_images_temp(
-                    pdf_path, temp_dir_path)
+                # Convert PDF to images; rendering is CPU-bound and
+                # synchronous, so keep it off the event loop
+                image_paths = await asyncio.to_thread(
+                    self._convert_pdf_to_images_temp, pdf_path, temp_dir_path)
 
                 if not image_paths:
                     self._logger.error(
-                        f"Failed to extract images from PDF: {diagnostic_id}")
+                        "Failed to extract images from PDF: %s", diagnostic_id)
                     await self._save_error_to_diagnostic(
                         diagnostic_id, "Failed to extract images from PDF")
                     # Remove from pending analysis since it failed
@@ -325,7 +467,7 @@ class BloodworkPdfAnalysisService:
 
                 if not analysis_result:
                     self._logger.error(
-                        f"Failed to analyze bloodwork: {diagnostic_id}")
+                        "Failed to analyze bloodwork: %s", diagnostic_id)
                     await self._save_error_to_diagnostic(
                         diagnostic_id, "AI analysis failed")
                     # Remove from pending analysis since it failed
@@ -339,8 +481,8 @@ class BloodworkPdfAnalysisService:
                 self.remove_pending_analysis(patient_id)
 
         except Exception as error:
-            error_msg = f"Error during AI analysis for diagnostic {diagnostic_id}: {error}"
-            self._logger.exception(error_msg)
+            self._logger.exception(
+                "Error during AI analysis for diagnostic %s: %s", diagnostic_id, error)
             await self._save_error_to_diagnostic(
                 diagnostic_id, f"Analysis error: {error}")
             # Remove from pending analysis since it failed
@@ -367,7 +509,7 @@ class BloodworkPdfAnalysisService:
             )
         except Exception as error:
             self._logger.error(
-                f"Error converting PDF to images: {error}")
+                "Error converting PDF to images: %s", error)
             return []
 
     async def _save_analysis_to_database(
@@ -397,27 +539,30 @@ class BloodworkPdfAnalysisService:
             diagnostic = await ai_repo.get_by_id(diagnostic_id)
             if not diagnostic:
                 self._logger.error(
-                    f"Diagnostic not found for updating: {diagnostic_id}")
+                    "Diagnostic not found for updating: %s", diagnostic_id)
                 return
 
             # Update only the necessary fields
             await ai_repo.update_processing_info(diagnostic_id, processing_info)
 
             # Parse JSON string to dict and update AI diagnostic
-            import json
             ai_diagnostic_dict = json.loads(analysis_result)
             update_data = {"ai_diagnostic": ai_diagnostic_dict}
             await ai_repo.collection.update_one(
                 {"_id": diagnostic_id},
                 {"$set": update_data}
             )
+            ai_repo.invalidate_latest(diagnostic.patient_id)
+
+            # Write-through so the first poll after completion is a cache hit
+            self._cache_analysis_result(diagnostic_id, ai_diagnostic_dict)
 
             self._logger.info(
-                f"Analysis saved for diagnostic: {diagnostic_id}")
+                "Analysis saved for diagnostic: %s", diagnostic_id)
 
         except Exception as error:
             self._logger.exception(
-                f"Error saving analysis to database: {error}")
+                "Error saving analysis to database: %s", error)
 
     async def _save_error_to_diagnostic(
         self,
@@ -441,11 +586,11 @@ class BloodworkPdfAnalysisService:
 
             await ai_repo.update_processing_info(diagnostic_id, processing_info)
             self._logger.info(
-                f"Error saved for diagnostic: {diagnostic_id}")
+                "Error saved for diagnostic: %s", diagnostic_id)
 
         except Exception as error:
             self._logger.exception(
-                f"Error saving diagnostic error: {error}")
+                "Error saving diagnostic error: %s", error)
 
     def get_model_version(self) -> str:
         """Get the OpenAI model version used for analysis."""
@@ -458,3 +603,15 @@ class BloodworkPdfAnalysisService:
     def get_confidence_score(self) -> float:
         """Get the confidence score of the last analysis."""
         return self._confidence_score
+
+
+# Process-wide service instance, created on first use instead of at import
+_pdf_analysis_service = None
+
+
+def get_pdf_analysis_service() -> BloodworkPdfAnalysisService:
+    """Get singleton PDF analysis service instance."""
+    global _pdf_analysis_service
+    if _pdf_analysis_service is None:
+        _pdf_analysis_service = BloodworkPdfAnalysisService()
+    return _pdf_analysis_service
@@ -0,0 +1,59 @@
+"""
+Keyset pagination helpers for the Veterinary Bloodwork Analyzer.
+
+This module provides the opaque page cursors used by newest-first listings.
+A cursor holds the created_at and _id of the last item of a page; _id
+breaks ties between documents created in the same millisecond (bulk
+inserts stamp a whole batch with one timestamp), so no document is ever
+skipped at a page boundary.
+
+Last updated: 2025-06-22
+Author: Bedirhan Gilgiler
+"""
+
+from datetime import datetime, timezone
+
+from bson.datetime_ms import DatetimeMS
+
+# Sort order matching the cursors below; indexes serving a keyset listing
+# must end with these keys in this direction
+NEWEST_FIRST_SORT = [("created_at", -1), ("_id", -1)]
+
+
+def encode_page_cursor(created_at: datetime, doc_id: str) -> str:
+    """
+    Build the cursor pointing just past a document in newest-first order.
+
+    Args:
+        created_at (datetime): created_at of the last document of the page
+        doc_id (str): _id of the last document of the page
+
+    Returns:
+        str: Opaque page cursor
+    """
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return f"{int(created_at.timestamp() * 1000)}.{doc_id}"
+
+
+def page_after_filter(cursor: str) -> dict:
+    """
+    Query filter selecting the documents that follow a cursor.
+
+    Args:
+        cursor (str): Cursor returned with the previous page
+
+    Returns:
+        dict: Filter to merge into the listing query
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    created_ms, _, doc_id = cursor.partition(".")
+    if not doc_id or not created_ms.isdigit():
+        raise ValueError(f"Invalid page cursor: {cursor}")
+    created_at = DatetimeMS(int(created_ms))
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": doc_id}},
+    ]}
@@ -0,0 +1,123 @@
+"""
+Upload guard middleware for the Veterinary Bloodwork Analyzer.
+
+This module provides a lightweight ASGI middleware that rejects invalid
+upload requests from their headers alone, before FastAPI starts reading
+and spooling the multipart body.
+
+Last updated: 2025-06-22
+Author: Bedirhan Gilgiler
+"""
+
+from typing import Iterable
+
+from app.utils.logger_utils import ApplicationLogger
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Default upper bound for an uploaded bloodwork report
+DEFAULT_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+PAYLOAD_TOO_LARGE_DETAIL = "File troppo grande."
+
+
+class UploadGuardMiddleware:
+    """
+    Reject invalid requests to upload endpoints before the body is read.
+
+    FastAPI parses form bodies before any route dependency runs, so header
+    checks have to happen at the ASGI layer to avoid transferring the body
+    of a request that is going to be refused anyway:
+
+    - non-multipart requests get 415
+    - a Content-Length above the limit gets 413
+    - bodies without Content-Length (chunked) are counted as they are
+      received and aborted with 413 once they pass the limit
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: Iterable[str],
+        max_body_size: int = DEFAULT_MAX_UPLOAD_BYTES
+    ):
+        """
+        Initialize the middleware.
+
+        Args:
+            app (ASGIApp): Wrapped ASGI application
+            paths (Iterable[str]): Exact request paths that accept uploads
+            max_body_size (int): Largest accepted request body in bytes
+        """
+        self._app = app
+        self._paths = frozenset(paths)
+        self._max_body_size = max_body_size
+        self._logger = ApplicationLogger.get_logger("upload_guard")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http" or scope["method"] != "POST"
+                or scope["path"] not in self._paths):
+            await self._app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
+        content_type = headers.get("content-type", "")
+        if not content_type.startswith("multipart/form-data"):
+            self._logger.warning(
+                "Rejected upload to %s: unsupported content type %s",
+                scope["path"], content_type or "<none>")
+            await self._reject(scope, receive, send, 415,
+                               "Solo file PDF sono accettati.")
+            return
+
+        content_length = headers.get("content-length")
+        if content_length is not None:
+            if content_length.isdigit() and int(content_length) > self._max_body_size:
+                self._logger.warning(
+                    "Rejected upload to %s: %s bytes exceeds limit of %d",
+                    scope["path"], content_length, self._max_body_size)
+                await self._reject(scope, receive, send, 413,
+                                   PAYLOAD_TOO_LARGE_DETAIL)
+                return
+            await self._app(scope, receive, send)
+            return
+
+        await self._app(scope, self._limit_body(receive), send)
+
+    def _limit_body(self, receive: Receive) -> Receive:
+        """
+        Wrap receive so a body without Content-Length cannot exceed the limit.
+
+        The HTTPException raised here surfaces from FastAPI's form parsing
+        and is rendered by the regular exception handling as a 413.
+        """
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self._max_body_size:
+                    self._logger.warning(
+                        "Aborted chunked upload after %d bytes", received)
+                    raise HTTPException(
+                        status_code=413, detail=PAYLOAD_TOO_LARGE_DETAIL)
+            return message
+
+        return limited_receive
+
+    @staticmethod
+    async def _reject(
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        status_code: int,
+        detail: str
+    ) -> None:
+        """Send an error response without touching the request body."""
+        response = JSONResponse({"detail": detail}, status_code=status_code)
+        await response(scope, receive, send)